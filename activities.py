@@ -1,60 +1,430 @@
-from collections import defaultdict
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator
 
 import discord
+from discord.ext import tasks
 import kronicler
 
+import activity_store
+
+
+# One JSON file per guild holding per-member message counts and last message
+# times, plus the newest message id already counted in each channel. Counts
+# and marks are saved together, so after a crash the next >activity simply
+# refetches whatever came after the saved marks. Per-message metadata for
+# windowed queries lives next to it in activity_index/<guild_id>/ (see
+# activity_store).
+ACTIVITY_INDEX_DIR = Path("activity_index")
+FLUSH_INTERVAL_MINUTES = 1
+
+# Channels are scanned in parallel. History requests are rate limited per
+# channel, so a few at a time stays well inside Discord's global limit.
+SCAN_CONCURRENCY = 4
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+# The report is DMed in line-aligned chunks. Past this many messages the
+# rest is not sent as more DMs; the full report comes as a CSV attachment.
+REPORT_CHUNK_SIZE = 2000
+MAX_REPORT_MESSAGES = 5
+
+
+@dataclass(slots=True)
+class ActivityIndex:
+    guild_id: int
+    message_counts: dict[int, int] = field(default_factory=dict)
+    last_messages: dict[int, float] = field(default_factory=dict)
+    channel_marks: dict[int, int] = field(default_factory=dict)
+    scanning: set[int] = field(default_factory=set)
+    # Channels scanned up to date since the bot started; only these are
+    # counted live, since messages sent while it was offline are not seen.
+    live_channels: set[int] = field(default_factory=set)
+    columns: activity_store.MessageColumns | None = None
+    dirty: bool = False
+
+    def record(self, author_id: int, created_at: datetime, channel_id: int):
+        self.message_counts[author_id] = self.message_counts.get(author_id, 0) + 1
+        timestamp = created_at.timestamp()
+        if timestamp > self.last_messages.get(author_id, 0.0):
+            self.last_messages[author_id] = timestamp
+        if self.columns is not None:
+            self.columns.append(author_id, channel_id, timestamp)
+        self.dirty = True
+
+    def merge_scan(
+        self,
+        channel_id: int,
+        mark: int,
+        counts: dict[int, int],
+        last_messages: dict[int, float],
+        rows: list[tuple[int, float]],
+    ):
+        """Apply a finished channel scan together with its new mark."""
+        for author_id, count in counts.items():
+            self.message_counts[author_id] = self.message_counts.get(author_id, 0) + count
+        for author_id, timestamp in last_messages.items():
+            if timestamp > self.last_messages.get(author_id, 0.0):
+                self.last_messages[author_id] = timestamp
+        if self.columns is not None:
+            for author_id, timestamp in rows:
+                self.columns.append(author_id, channel_id, timestamp)
+        self.channel_marks[channel_id] = mark
+        self.dirty = True
+
+
+_INDEXES: dict[int, ActivityIndex] = {}
+_SCAN_LOCKS: dict[int, asyncio.Lock] = {}
+
+
+def _index_path(guild_id: int) -> Path:
+    return ACTIVITY_INDEX_DIR / f"{guild_id}.json"
+
+
+@kronicler.capture
+def load_index(guild_id: int) -> ActivityIndex:
+    path = _index_path(guild_id)
+    columns = activity_store.MessageColumns(ACTIVITY_INDEX_DIR / str(guild_id))
+    if not path.exists():
+        return ActivityIndex(guild_id=guild_id, columns=columns)
+
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return ActivityIndex(
+        guild_id=guild_id,
+        message_counts={int(k): int(v) for k, v in data.get("message_counts", {}).items()},
+        last_messages={int(k): float(v) for k, v in data.get("last_messages", {}).items()},
+        channel_marks={int(k): int(v) for k, v in data.get("channel_marks", {}).items()},
+        columns=columns,
+    )
+
 
 @kronicler.capture
-async def get_activity(ctx, limit: int):
-    await ctx.send("Collecting data, this may take a moment...")
-
-    members = {member.id: member for member in ctx.guild.members if not member.bot}
-    message_counts = defaultdict(int)
-    last_messages = {}
-
-    # Loop through all text channels
-    for channel in ctx.guild.text_channels:
-        try:
-            async for message in channel.history(limit=limit):
-                if message.author.bot:
-                    continue
-                message_counts[message.author.id] += 1
-                # Update last message timestamp if this message is newer
-                if (
-                    message.author.id not in last_messages
-                    or message.created_at > last_messages[message.author.id]
-                ):
-                    last_messages[message.author.id] = message.created_at
-        except discord.Forbidden:
-            continue  # Skip channels the bot can't read
-        except discord.HTTPException:
-            continue  # Skip on rate limit or errors
-
-    report_lines = []
-    for member_id, member in members.items():
-        last_msg_time = last_messages.get(member_id, None)
-        total_msgs = message_counts.get(member_id, 0)
+def save_index(index: ActivityIndex):
+    ACTIVITY_INDEX_DIR.mkdir(exist_ok=True)
+    if index.columns is not None:
+        index.columns.flush()
+    path = _index_path(index.guild_id)
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(
+        json.dumps(
+            {
+                "message_counts": index.message_counts,
+                "last_messages": index.last_messages,
+                "channel_marks": index.channel_marks,
+            }
+        ),
+        encoding="utf-8",
+    )
+    tmp_path.replace(path)
+    index.dirty = False
+
+
+def get_index(guild_id: int) -> ActivityIndex:
+    index = _INDEXES.get(guild_id)
+    if index is None:
+        index = _INDEXES[guild_id] = load_index(guild_id)
+    return index
+
+
+def save_dirty_indexes():
+    for index in _INDEXES.values():
+        if index.dirty:
+            save_index(index)
+
+
+def on_message(message: discord.Message):
+    """Count a new message live, for channels scanned since the bot started."""
+    if message.guild is None:
+        return
+
+    index = get_index(message.guild.id)
+    channel_id = message.channel.id
+    # Other channels may have a gap between their saved mark and now; leaving
+    # the mark alone lets the next scan fetch that gap along with this message.
+    if channel_id not in index.live_channels or channel_id in index.scanning:
+        return
+    if message.id <= index.channel_marks.get(channel_id, 0):
+        return
+
+    # Bot messages (including this bot's own replies) are not counted, but
+    # still move the mark so they don't make the channel look unscanned.
+    if not message.author.bot:
+        index.record(message.author.id, message.created_at, channel_id)
+    index.channel_marks[channel_id] = message.id
+    index.dirty = True
+
+
+def _needs_scan(index: ActivityIndex, channel: discord.TextChannel) -> bool:
+    mark = index.channel_marks.get(channel.id)
+    if mark is None:
+        return True
+    return channel.last_message_id is not None and channel.last_message_id > mark
+
+
+@kronicler.capture
+async def _scan_channel(index: ActivityIndex, channel: discord.TextChannel, limit: int):
+    mark = index.channel_marks.get(channel.id)
+    if mark is None:
+        # First look at this channel: backfill the most recent `limit` messages.
+        history = channel.history(limit=limit)
+    else:
+        history = channel.history(limit=None, after=discord.Object(id=mark))
+
+    # Results stay local until the history is fully read: a scan that fails
+    # part way leaves the index (and anything flushed from it) untouched, and
+    # the next scan starts again from the old mark.
+    counts: dict[int, int] = {}
+    last_messages: dict[int, float] = {}
+    rows: list[tuple[int, float]] = []
+    newest = mark or 0
+    index.scanning.add(channel.id)
+    try:
+        async for message in history:
+            newest = max(newest, message.id)
+            if message.author.bot:
+                continue
+            author_id = message.author.id
+            timestamp = message.created_at.timestamp()
+            counts[author_id] = counts.get(author_id, 0) + 1
+            if timestamp > last_messages.get(author_id, 0.0):
+                last_messages[author_id] = timestamp
+            rows.append((author_id, timestamp))
+        index.merge_scan(channel.id, newest, counts, last_messages, rows)
+        # History pages newest first, so anything posted while the scan ran
+        # is in neither the scan nor the live count (on_message skips
+        # channels mid-scan). Such a channel stays off the live list and the
+        # next scan picks those messages up after the new mark.
+        if channel.last_message_id is None or channel.last_message_id <= newest:
+            index.live_channels.add(channel.id)
+    finally:
+        index.scanning.discard(channel.id)
+
+
+@kronicler.capture
+async def _scan_channels(ctx, index: ActivityIndex, channels: list, limit: int):
+    """Scan ``channels`` a few at a time, editing a progress message as they finish."""
+    total = len(channels)
+    progress = await ctx.send(f"Catching up on channels: 0/{total} done...")
+    semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+    done = 0
+    last_update = time.monotonic()
+
+    async def scan(channel):
+        nonlocal done, last_update
+        async with semaphore:
+            try:
+                await _scan_channel(index, channel, limit)
+            except discord.Forbidden:
+                pass  # Skip channels the bot can't read
+            except discord.HTTPException:
+                pass  # Skip on rate limit or errors
+
+        done += 1
+        now = time.monotonic()
+        if done < total and now - last_update >= PROGRESS_INTERVAL_SECONDS:
+            last_update = now
+            try:
+                await progress.edit(content=f"Catching up on channels: {done}/{total} done...")
+            except discord.HTTPException:
+                pass
+
+    await asyncio.gather(*(scan(channel) for channel in channels))
+    try:
+        await progress.edit(content=f"Caught up on channels: {total}/{total} done.")
+    except discord.HTTPException:
+        pass
+
+
+async def _catch_up(ctx, limit: int) -> ActivityIndex:
+    """Bring the guild's index up to date and return it."""
+    index = get_index(ctx.guild.id)
+    lock = _SCAN_LOCKS.setdefault(ctx.guild.id, asyncio.Lock())
+
+    async with lock:
+        pending = []
+        for channel in ctx.guild.text_channels:
+            if _needs_scan(index, channel):
+                pending.append(channel)
+            else:
+                index.live_channels.add(channel.id)
+        if pending:
+            await _scan_channels(ctx, index, pending, limit)
+        if index.dirty:
+            save_index(index)
+    return index
+
+
+_WINDOW_RE = re.compile(r"(\d+)([hdw])")
+_WINDOW_SECONDS = {"h": 3600, "d": 86400, "w": 7 * 86400}
+_CHANNEL_RE = re.compile(r"<#(\d+)>")
+ACTIVITY_USAGE = (
+    "Usage: `>activity [limit] [csv]` or `>activity [7d|24h|2w] [#channel] [top]`"
+)
+
+
+async def handle_activity(ctx, args: tuple[str, ...]):
+    """Dispatch ``>activity`` to the full report or a windowed query."""
+    number: int | None = None
+    window: int | None = None
+    label = ""
+    channel = None
+    as_csv = False
+    for arg in args:
+        if arg.isdigit():
+            number = int(arg)
+        elif arg.lower() == "csv":
+            as_csv = True
+        elif match := _WINDOW_RE.fullmatch(arg.lower()):
+            window = int(match.group(1)) * _WINDOW_SECONDS[match.group(2)]
+            label = arg.lower()
+        elif match := _CHANNEL_RE.fullmatch(arg):
+            channel = ctx.guild.get_channel(int(match.group(1)))
+            if channel is None:
+                await ctx.send(f"Unknown channel {arg}.")
+                return
+        else:
+            await ctx.send(ACTIVITY_USAGE)
+            return
+
+    if window is None and channel is None:
+        await get_activity(ctx, number or 1000, as_csv=as_csv)
+    else:
+        # In windowed mode a bare number picks how many members to list.
+        await get_activity_window(ctx, window, label, channel, top=number or 10)
+
+
+@kronicler.capture
+async def get_activity_window(ctx, window: int | None, label: str, channel, top: int = 10):
+    """Report message counts, a daily histogram and the top members for a window."""
+    index = await _catch_up(ctx, 1000)
+    since = int(time.time()) - window if window is not None else None
+    stats = index.columns.query(since=since, channel_id=channel.id if channel else None)
+
+    where = f" in {channel.mention}" if channel else ""
+    when = f" over the last {label}" if window else ""
+    if stats.total == 0:
+        await ctx.send(f"No messages recorded{where}{when}.")
+        return
+
+    lines = [f"**{stats.total}** messages from **{len(stats.author_ids)}** members{where}{when}."]
+    lines.append("```")
+    for rank, (author_id, count) in enumerate(stats.top(top), start=1):
+        member = ctx.guild.get_member(author_id)
+        name = member.name if member else str(author_id)
+        lines.append(f"{rank:>3}. {name:<24} {count}")
+    lines.append("")
+    peak = int(stats.day_counts.max())
+    for day, count in zip(stats.days[-14:].tolist(), stats.day_counts[-14:].tolist()):
+        date = datetime.fromtimestamp(day * activity_store.DAY_SECONDS, timezone.utc)
+        bar = "█" * max(1, round(20 * count / peak))
+        lines.append(f"{date:%Y-%m-%d} {bar} {count}")
+    lines.append("```")
+
+    report = "\n".join(lines)
+    if len(report) > 2000:
+        report = report[:1990].rsplit("\n", 1)[0] + "\n```"
+    await ctx.send(report)
+
+
+def _ranked_members(guild, index: ActivityIndex) -> list:
+    """Non-bot members, most messages first (ties: most recently active)."""
+    members = [member for member in guild.members if not member.bot]
+    members.sort(
+        key=lambda m: (
+            -index.message_counts.get(m.id, 0),
+            -index.last_messages.get(m.id, 0.0),
+        )
+    )
+    return members
+
+
+def _report_lines(members: Iterable, index: ActivityIndex) -> Iterator[str]:
+    for member in members:
+        last_msg_time = index.last_messages.get(member.id)
+        total_msgs = index.message_counts.get(member.id, 0)
         if last_msg_time:
             time_since_last = discord.utils.format_dt(
-                last_msg_time, style="R"
+                datetime.fromtimestamp(last_msg_time, timezone.utc), style="R"
             )  # Relative time
         else:
             time_since_last = "No messages found"
-        report_lines.append(
-            f"{member.name}#{member.discriminator}: Last message {time_since_last}, Total messages: {total_msgs}"
+        yield f"{member.name}#{member.discriminator}: Last message {time_since_last}, Total messages: {total_msgs}"
+
+
+def iter_report_chunks(lines: Iterable[str], size: int = REPORT_CHUNK_SIZE) -> Iterator[str]:
+    """Group ``lines`` into messages of at most ``size`` chars, never splitting a line."""
+    chunk: list[str] = []
+    length = 0
+    for line in lines:
+        if len(line) > size:
+            line = line[: size - 1] + "…"
+        if chunk and length + 1 + len(line) > size:
+            yield "\n".join(chunk)
+            chunk = []
+            length = 0
+        length += len(line) + (1 if chunk else 0)
+        chunk.append(line)
+    if chunk:
+        yield "\n".join(chunk)
+
+
+def build_report_csv(members: Iterable, index: ActivityIndex) -> io.BytesIO:
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(["member_id", "name", "messages", "last_message_utc"])
+    for member in members:
+        last_msg_time = index.last_messages.get(member.id)
+        writer.writerow(
+            [
+                member.id,
+                member.name,
+                index.message_counts.get(member.id, 0),
+                datetime.fromtimestamp(last_msg_time, timezone.utc).isoformat()
+                if last_msg_time
+                else "",
+            ]
         )
+    return io.BytesIO(text.getvalue().encode("utf-8"))
+
 
-    # Split into chunks if too long
-    chunk_size = 2000
-    report_text = "\n".join(report_lines)
-    chunks = [
-        report_text[i : i + chunk_size] for i in range(0, len(report_text), chunk_size)
-    ]
+@kronicler.capture
+async def get_activity(ctx, limit: int, as_csv: bool = False):
+    index = await _catch_up(ctx, limit)
+    members = _ranked_members(ctx.guild, index)
 
-    # Send DM to user
+    # Chunks are produced lazily and sent as soon as each one is ready; once
+    # the message budget is used up the CSV replaces the remaining DMs.
+    max_messages = 1 if as_csv else MAX_REPORT_MESSAGES
+    attach = as_csv
     try:
-        for chunk in chunks:
+        sent = 0
+        for chunk in iter_report_chunks(_report_lines(members, index)):
+            if sent == max_messages:
+                attach = True
+                break
             await ctx.author.send(chunk)
+            sent += 1
+        if attach:
+            await ctx.author.send(
+                f"Full report for {len(members)} members attached.",
+                file=discord.File(build_report_csv(members, index), filename="activity.csv"),
+            )
         await ctx.send("✅ Check your DMs for the activity report!")
     except discord.Forbidden:
         await ctx.send("❌ I couldn't DM you. Do you have DMs disabled?")
+
+
+def create_activity_flush():
+    @tasks.loop(minutes=FLUSH_INTERVAL_MINUTES)
+    async def flush_activity_indexes():
+        save_dirty_indexes()
+
+    return flush_activity_indexes
@@ -0,0 +1,79 @@
+"""Compare ``opengraph.parse_og`` with the old per-property regex search.
+
+Run from the repository root:
+
+    python -m benchmarks.opengraph_parse
+"""
+
+import re
+import timeit
+
+import opengraph
+
+
+def legacy_og_match(html: str, prop: str) -> str | None:
+    """The per-call regex ``notifications._fetch_og_data`` used to run."""
+    m = re.search(
+        rf'<meta[^>]+property=["\']og:{prop}["\'][^>]+content=["\']([^"\']+)["\']'
+        rf'|<meta[^>]+content=["\']([^"\']+)["\'][^>]+property=["\']og:{prop}["\']',
+        html,
+    )
+    return (m.group(1) or m.group(2)) if m else None
+
+
+def legacy_parse(html: str) -> dict[str, str | None]:
+    return {"title": legacy_og_match(html, "title"), "image": legacy_og_match(html, "image")}
+
+
+def build_page(head_tags: int, body_kb: int, og_at_end: bool) -> str:
+    """A news-site-like page: a long head full of scripts, links and meta tags."""
+    filler = []
+    for i in range(head_tags):
+        if i % 3 == 0:
+            filler.append(f'<meta name="x-tag-{i}" content="value {i}">')
+        elif i % 3 == 1:
+            filler.append(f'<link rel="preload" href="/static/chunk-{i}.js" as="script">')
+        else:
+            filler.append(f"<script>window.__data_{i} = {{a: {i}, b: 'x'}};</script>")
+    og = (
+        '<meta property="og:title" content="A headline about something">'
+        '<meta property="og:description" content="Summary &amp; more">'
+        '<meta content="https://example.com/lead.jpg" property="og:image">'
+        '<meta name="twitter:card" content="summary_large_image">'
+    )
+    head = "".join(filler + [og] if og_at_end else [og] + filler)
+    body = "<p>" + "lorem ipsum dolor sit amet " * (body_kb * 1024 // 27) + "</p>"
+    return f"<html><head><title>t</title>{head}</head><body>{body}</body></html>"
+
+
+def main():
+    cases = [
+        ("small head, og first", build_page(20, 50, og_at_end=False)),
+        ("large head, og last", build_page(400, 200, og_at_end=True)),
+        ("huge head, og last", build_page(2000, 500, og_at_end=True)),
+    ]
+    for label, page in cases:
+        # The fetcher only hands the parser the document up to </head>.
+        head = page[: page.lower().find("</head>") + len("</head>")]
+        current_result = opengraph.parse_og(head)
+        legacy_result = legacy_parse(page)
+        assert current_result["title"] == legacy_result["title"], "titles disagree"
+        assert current_result["image"] == legacy_result["image"], "images disagree"
+
+        number = 200
+        # The old fetcher searched the whole page; also time it on just the
+        # head to separate the parser's gain from the fetcher's truncation.
+        page_legacy = min(timeit.repeat(lambda: legacy_parse(page), number=number, repeat=5))
+        head_legacy = min(timeit.repeat(lambda: legacy_parse(head), number=number, repeat=5))
+        current = min(timeit.repeat(lambda: opengraph.parse_og(head), number=number, repeat=5))
+        print(
+            f"{label:<22} ({len(page) // 1024:>4} KB page, {len(head) // 1024:>3} KB head): "
+            f"legacy {page_legacy / number * 1e6:7.1f} us (page) "
+            f"{head_legacy / number * 1e6:7.1f} us (head), "
+            f"single pass {current / number * 1e6:7.1f} us, "
+            f"{page_legacy / current:4.1f}x / {head_legacy / current:4.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
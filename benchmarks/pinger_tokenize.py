@@ -0,0 +1,118 @@
+"""Compare ``pinger.tokenize`` with the old character-by-character tokenizer.
+
+Run from the repository root:
+
+    python -m benchmarks.pinger_tokenize
+"""
+
+import timeit
+
+import pinger
+
+
+def legacy_tokenize(expr: str):
+    """The character-by-character tokenizer ``pinger.tokenize`` replaced."""
+    tokens = []
+    i = 0
+    n = len(expr)
+    while i < n:
+        char = expr[i]
+        if char.isspace():
+            i += 1
+        elif char == "(":
+            tokens.append(("lparen", "("))
+            i += 1
+        elif char == ")":
+            tokens.append(("rparen", ")"))
+            i += 1
+        elif char == "&":
+            tokens.append(("op", "&"))
+            i += 1
+        elif char == "|":
+            tokens.append(("op", "|"))
+            i += 1
+        elif char == "^":
+            tokens.append(("op", "^"))
+            i += 1
+        elif char == "!":
+            tokens.append(("not", "!"))
+            i += 1
+        elif char == "<":
+            # A raw Discord mention like <@&123> (role) or <@123> (user).
+            end = expr.find(">", i)
+            if end == -1:
+                raise ValueError("Unterminated mention (missing '>').")
+            tokens.append(("operand", expr[i : end + 1]))
+            i = end + 1
+        elif char == "@":
+            # A textual operand: read until the next operator/paren/mention.
+            j = i + 1
+            while j < n and expr[j] not in "&|^!()<":
+                j += 1
+            name = expr[i + 1 : j].strip()
+            if not name:
+                raise ValueError("Empty target after '@'.")
+            tokens.append(("operand", "@" + name))
+            i = j
+        elif char.isalpha() or char == "_":
+            # A bare role name without '@' prefix (e.g. from the slash command).
+            j = i
+            while j < n and expr[j] not in "&|^!()<@":
+                j += 1
+            name = expr[i:j].strip()
+            if name:
+                tokens.append(("operand", "@" + name))
+            i = j
+        else:
+            raise ValueError(f"Unexpected character {char!r} in target expression.")
+    return tokens
+
+
+
+def build_expression(operands: int) -> str:
+    """A long but realistic expression: mentions, roles, groups and negation."""
+    parts = []
+    for i in range(operands):
+        if i % 4 == 0:
+            part = f"<@&{10**17 + i}>"
+        elif i % 4 == 1:
+            part = f"@Rusty Minecraft {i}"
+        elif i % 4 == 2:
+            part = f"!(@here & Mods {i})"
+        else:
+            part = f"Role_{i}"
+        parts.append(part)
+    expr = parts[0]
+    for i, part in enumerate(parts[1:], 1):
+        expr += (" & ", " | ", " ^ ")[i % 3] + part
+    return expr
+
+
+def best_of(funcs, expr: str, number: int, repeat: int = 50) -> list[float]:
+    """Best time per call for each function, interleaving runs to even out noise."""
+    best = [float("inf")] * len(funcs)
+    for _ in range(repeat):
+        for i, func in enumerate(funcs):
+            elapsed = timeit.timeit(lambda: func(expr), number=number)
+            best[i] = min(best[i], elapsed / number)
+    return best
+
+
+def main():
+    for operands in (2, 8, 64, 512, 4096):
+        expr = build_expression(operands)
+        new = [(kind, value) for kind, value, _, _ in pinger.tokenize(expr)]
+        assert new == legacy_tokenize(expr), "tokenizers disagree"
+
+        number = max(1, 4000 // operands)
+        legacy, current = best_of([legacy_tokenize, pinger.tokenize], expr, number)
+        print(
+            f"{operands:>5} operands ({len(expr):>6} chars): "
+            f"legacy {legacy * 1e6:9.1f} us, "
+            f"current {current * 1e6:9.1f} us, "
+            f"{legacy / current:4.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,11 @@ import bowling
 import antispam
 import latex
 import notifications
+import og_cache
+import opengraph
+import pending_links
 import pinger
+import ping_index
 import hyeval
 import audit_log
 import link_log
@@ -40,6 +44,9 @@ BOT_CONFIG = load_bot_config(BOT_CONFIG_PATH)
 CHANNEL_ID = int(BOT_CONFIG["channel_id"])
 INVITE_LINK = str(BOT_CONFIG.get("invite_link", "")).strip()
 ADMIN_ID = int(BOT_CONFIG.get("admin_id", 0))
+NOTIFICATION_STREAMS_PATH = Path(
+    str(BOT_CONFIG.get("notification_streams", notifications.NOTIFICATION_STREAMS_PATH))
+)
 RESTART_EXIT_CODE = 42
 
 if "token" in BOT_CONFIG:
@@ -79,13 +86,40 @@ async def ping_expression_autocomplete(
     return pinger.get_autocomplete_choices(interaction.guild, current)
 
 
+@bot.tree.command(
+    name="pingcount", description="Count who a /ping expression would hit, without pinging"
+)
+@app_commands.describe(
+    expression="Set expression over roles/users, e.g. @here & Rusty Minecraft",
+)
+async def slash_pingcount(interaction: discord.Interaction, expression: str):
+    await pinger.handle_slash_pingcount(interaction, expression)
+
+
+@slash_pingcount.autocomplete("expression")
+async def pingcount_expression_autocomplete(
+    interaction: discord.Interaction,
+    current: str,
+) -> list[app_commands.Choice[str]]:
+    return pinger.get_autocomplete_choices(interaction.guild, current)
+
+
 @bot.event
 async def setup_hook():
     await bot.add_cog(bowling.Bowling(bot))
     await bot.tree.sync()
 
 daily_birthday_check = birthday.create_daily_birthday_check(bot, CHANNEL_ID)
-daily_notification_check = notifications.create_daily_notification_check(bot)
+notification_scheduler = notifications.create_notification_scheduler(
+    bot, NOTIFICATION_STREAMS_PATH
+)
+link_request_worker = notifications.create_link_request_worker(bot)
+activity_flush = activities.create_activity_flush()
+
+
+@bot.listen()
+async def on_message(message: discord.Message):
+    activities.on_message(message)
 
 
 @bot.event
@@ -93,21 +127,58 @@ async def on_message_delete(message: discord.Message):
     await audit_log.on_message_delete(message)
 
 
+@bot.event
+async def on_member_join(member: discord.Member):
+    ping_index.on_member_join(member)
+
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    ping_index.on_member_remove(member)
+
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    ping_index.on_member_update(before, after)
+
+
+@bot.event
+async def on_presence_update(before: discord.Member, after: discord.Member):
+    ping_index.on_presence_update(before, after)
+
+
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    ping_index.on_guild_role_create(role)
+
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    ping_index.on_guild_role_delete(role)
+
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    ping_index.on_guild_role_update(before, after)
+
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    ping_index.on_guild_remove(guild)
+
+
 @bot.event
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
     if str(payload.emoji) != "👍":
         return
-    url = notifications._PENDING_LINKS.get(payload.message_id)
-    if url is None:
-        return
     if payload.user_id == bot.user.id:
         return
-    try:
-        user = await bot.fetch_user(payload.user_id)
-        await user.send(url)
-        link_log.record(user.id, str(user), url)
-    except Exception as exc:
-        print(f"Failed to DM link to {payload.user_id}: {exc}")
+    url = pending_links.get_store().get(payload.message_id)
+    if url is None:
+        return
+    # Delivery happens on the link request worker so a burst of reactions
+    # never holds up the gateway.
+    notifications.request_link(payload.message_id, payload.user_id, url)
 
 
 @bot.event
@@ -116,8 +187,12 @@ async def on_ready():
     await bot.change_presence(activity=discord.Game("Hey! Use '/ping'"))
     if not daily_birthday_check.is_running():
         daily_birthday_check.start()
-    if not daily_notification_check.is_running():
-        daily_notification_check.start()
+    if not notification_scheduler.is_running():
+        notification_scheduler.start()
+    if not link_request_worker.is_running():
+        link_request_worker.start()
+    if not activity_flush.is_running():
+        activity_flush.start()
 
 
 def format_timedelta(td):
@@ -136,10 +211,19 @@ def format_timedelta(td):
 
 
 
+@bot.command(name="pingcache")
+async def ping_cache(ctx):
+    """Show /ping expression cache hit and miss counts."""
+    await ctx.send(pinger.cache_stats())
+
+
 @bot.command()
-async def activity(ctx, limit: int = 1000):
-    """See how much activity each person has on a server by message count."""
-    await activities.get_activity(ctx, limit)
+async def activity(ctx, *args: str):
+    """See how much activity each person has on a server by message count.
+
+    Usage: >activity [limit] [csv] or >activity [7d|24h|2w] [#channel] [top]
+    """
+    await activities.handle_activity(ctx, args)
 
 
 @bot.command()
@@ -156,7 +240,7 @@ async def birthdays(ctx):
 async def notify_group(ctx):
     """Notification stream utilities."""
     await ctx.send(
-        "Use `>notify list`, `>notify signup <stream> [dm|channel]`, "
+        "Use `>notify list`, `>notify signup <stream> [dm|channel] [digest]`, "
         "`>notify unsubscribe <stream>`, or `>notify run`."
     )
 
@@ -164,7 +248,7 @@ async def notify_group(ctx):
 @notify_group.command(name="list")
 async def notify_list(ctx):
     """List available notification streams."""
-    names = notifications.list_stream_names(notifications.NOTIFICATION_STREAMS_PATH)
+    names = notifications.list_stream_names(NOTIFICATION_STREAMS_PATH)
     if not names:
         await ctx.send("No notification streams are configured.")
         return
@@ -173,15 +257,20 @@ async def notify_list(ctx):
 
 
 @notify_group.command(name="signup")
-async def notify_signup(ctx, stream: str, delivery: str = "dm"):
-    """Sign up for a notification stream."""
+async def notify_signup(ctx, stream: str, delivery: str = "dm", mode: str = ""):
+    """Sign up for a notification stream, optionally as a digest."""
+    if mode.strip().lower() not in {"", "digest"}:
+        await ctx.send("The last option must be `digest` (or left out).")
+        return
+    digest = mode.strip().lower() == "digest"
     channel_id = ctx.channel.id if delivery.strip().lower() == "channel" else None
     ok, message = await notifications.subscribe(
-        notifications.NOTIFICATION_STREAMS_PATH,
+        NOTIFICATION_STREAMS_PATH,
         stream,
         ctx.author.id,
         delivery,
         channel_id,
+        digest,
     )
     await ctx.send(message)
     if ok and delivery.strip().lower() == "dm":
@@ -194,7 +283,7 @@ async def notify_signup(ctx, stream: str, delivery: str = "dm"):
 async def notify_unsubscribe(ctx, stream: str):
     """Remove your notification stream subscription."""
     _, message = await notifications.unsubscribe(
-        notifications.NOTIFICATION_STREAMS_PATH,
+        NOTIFICATION_STREAMS_PATH,
         stream,
         ctx.author.id,
     )
@@ -210,6 +299,31 @@ async def notify_links(ctx, limit: int = 50):
     await ctx.send(link_log.read_log(limit))
 
 
+@notify_group.command(name="cache")
+async def notify_cache(ctx):
+    """Show OpenGraph cache size and hit rates. Admin only."""
+    if ADMIN_ID == 0 or ctx.author.id != ADMIN_ID:
+        await ctx.send("You are not authorized to run this command.")
+        return
+    await ctx.send(f"```\n{og_cache.get_cache().summary()}\n```")
+
+
+@notify_group.command(name="import")
+async def notify_import(ctx):
+    """Copy notification_streams.toml into the SQLite stream store. Admin only."""
+    if ADMIN_ID == 0 or ctx.author.id != ADMIN_ID:
+        await ctx.send("You are not authorized to run this command.")
+        return
+    if NOTIFICATION_STREAMS_PATH.suffix not in notifications.SQLITE_SUFFIXES:
+        await ctx.send("Set `notification_streams` in bot.toml to a `.sqlite3` path first.")
+        return
+
+    streams, subscribers = notifications.import_toml_streams(
+        notifications.NOTIFICATION_STREAMS_PATH, NOTIFICATION_STREAMS_PATH
+    )
+    await ctx.send(f"Imported {streams} stream(s) and {subscribers} subscriber(s).")
+
+
 @notify_group.command(name="post")
 async def notify_post(ctx, stream: str, url: str):
     """Send a URL as a manual event to a stream. Admin only."""
@@ -219,7 +333,7 @@ async def notify_post(ctx, stream: str, url: str):
 
     await ctx.send(f"Fetching `{url}` and sending to `{stream}`...")
     found, err, sent = await notifications.send_url_to_stream(
-        bot, notifications.NOTIFICATION_STREAMS_PATH, stream, url
+        bot, NOTIFICATION_STREAMS_PATH, stream, url
     )
     if not found:
         await ctx.send(err)
@@ -233,15 +347,22 @@ async def notify_post(ctx, stream: str, url: str):
 async def notify_run(ctx):
     """Manually run all notification streams once."""
     sent = await notifications.dispatch_notifications(
-        bot, notifications.NOTIFICATION_STREAMS_PATH
+        bot, NOTIFICATION_STREAMS_PATH
     )
     if not sent:
         await ctx.send("No streams were processed.")
         return
 
+    load_times = notifications.script_load_times()
     lines = ["Notification run complete:", "```"]
     for stream, count in sorted(sent.items()):
-        lines.append(f"{stream}: {count} sent")
+        line = f"{stream}: {count} sent"
+        if stream in load_times:
+            line += f" (script loaded in {load_times[stream]:.3f}s)"
+        lines.append(line)
+    stats = notifications.last_delivery_stats()
+    if stats is not None:
+        lines.append(stats.summary())
     lines.append("```")
     await ctx.send("\n".join(lines))
 
@@ -313,6 +434,9 @@ async def update(ctx):
         return
 
     await ctx.send(f"```\n{result.stdout.strip()}\n```\nRestarting...")
+    activities.save_dirty_indexes()
+    await notifications.flush_registries()
+    await opengraph.close_session()
     await bot.close()
     sys.exit(RESTART_EXIT_CODE)
 
@@ -1,26 +1,61 @@
 from __future__ import annotations
 
 import asyncio
-import re
+import hashlib
+import inspect
+import random
+import sqlite3
 from dataclasses import dataclass
-from datetime import time, timedelta, timezone
+from datetime import datetime, timedelta, timezone
 from importlib.util import module_from_spec, spec_from_file_location
 from pathlib import Path
+from time import perf_counter
 from types import ModuleType
-from typing import Any
+from typing import Any, AsyncIterator, Awaitable, Callable
 
-import aiohttp
 import discord
 from discord.ext import tasks
 import kronicler
 import tomllib
 
+import link_log
+import opengraph
+import pending_links
+import schedules
+
 
 NOTIFICATION_STREAMS_PATH = Path("notification_streams.toml")
+# A streams path with one of these suffixes is a SQLite database instead of TOML.
+SQLITE_SUFFIXES = {".db", ".sqlite", ".sqlite3"}
 MY_TIMEZONE = timezone(timedelta(hours=-8))
 
-# Maps sent message IDs to their hidden URLs so reactions can trigger DM delivery.
-_PENDING_LINKS: dict[int, str] = {}
+# How many streams dispatch_notifications runs at once, and how long a
+# stream's get_new_events() may take unless the stream sets its own timeout.
+STREAM_CONCURRENCY = 4
+STREAM_TIMEOUT_SECONDS = 120.0
+
+# Streams without a `schedule` keep the old once-a-day run at 12:05. Each run
+# is pushed back by up to `jitter` seconds (default below) to spread load.
+DEFAULT_SCHEDULE = "5 12 * * *"
+SCHEDULE_JITTER_SECONDS = 60.0
+SCHEDULER_TICK_SECONDS = 30
+# Events a stream script may run ahead of delivery before it is paused.
+EVENT_QUEUE_SIZE = 16
+
+# Sends in flight at once across every stream of a run, and how often a send
+# that hit a 429 or a 5xx is retried (with exponential backoff) before giving up.
+DELIVERY_CONCURRENCY = 8
+DELIVERY_RETRIES = 3
+RETRY_BASE_SECONDS = 1.0
+LINK_QUEUE_SIZE = 1000
+
+# Discord's per-message limits, which digest messages are packed up to.
+DIGEST_MESSAGE_CHARS = 2000
+DIGEST_MAX_EMBEDS = 10
+DIGEST_LINK_NOTE = "React with 👍 to receive the links via DM"
+
+# Signups arriving within this window are persisted with a single write.
+WRITE_DELAY_SECONDS = 1.0
 
 
 @dataclass(slots=True)
@@ -28,6 +63,8 @@ class Subscriber:
     user_id: int
     delivery: str
     channel_id: int | None = None
+    # Collect a run's events into as few messages as possible.
+    digest: bool = False
 
 
 @dataclass(slots=True)
@@ -35,9 +72,36 @@ class StreamConfig:
     name: str
     script: Path
     subscribers: list[Subscriber]
+    timeout: float | None = None
+    schedule: str | None = None
+    jitter: float | None = None
+
+
+@dataclass(slots=True)
+class DeliveryStats:
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def per_second(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.sent} sent, {self.failed} failed, {self.retries} retried "
+            f"in {self.elapsed:.2f}s ({self.per_second:.1f} msg/s)"
+        )
 
 
-_write_lock = asyncio.Lock()
+_DM_CHANNELS: dict[int, discord.DMChannel] = {}
+_LAST_DELIVERY: DeliveryStats | None = None
+# 👍 link requests waiting for the worker, and the (message, user) pairs in it.
+_LINK_REQUESTS: asyncio.Queue[tuple[int, int, str]] = asyncio.Queue(maxsize=LINK_QUEUE_SIZE)
+_QUEUED_LINKS: set[tuple[int, int]] = set()
+# Held while a stream runs, so scheduled and manual runs never overlap.
+_STREAM_LOCKS: dict[str, asyncio.Lock] = {}
 
 
 def _toml_quote(value: str) -> str:
@@ -60,6 +124,12 @@ def _dump_streams(streams: list[StreamConfig]) -> str:
         lines.append("[[streams]]")
         lines.append(f"name = {_toml_quote(stream.name)}")
         lines.append(f"script = {_toml_quote(stream.script.as_posix())}")
+        if stream.timeout is not None:
+            lines.append(f"timeout = {stream.timeout}")
+        if stream.schedule is not None:
+            lines.append(f"schedule = {_toml_quote(stream.schedule)}")
+        if stream.jitter is not None:
+            lines.append(f"jitter = {stream.jitter}")
 
         for sub in stream.subscribers:
             lines.append("[[streams.subscribers]]")
@@ -67,6 +137,8 @@ def _dump_streams(streams: list[StreamConfig]) -> str:
             lines.append(f"delivery = {_toml_quote(sub.delivery)}")
             if sub.channel_id is not None:
                 lines.append(f"channel_id = {sub.channel_id}")
+            if sub.digest:
+                lines.append("digest = true")
 
     lines.append("")
     return "\n".join(lines)
@@ -84,10 +156,8 @@ def _ensure_config_file(path: Path):
 
 
 @kronicler.capture
-def load_streams(path: Path) -> list[StreamConfig]:
-    _ensure_config_file(path)
-
-    data = tomllib.loads(path.read_text(encoding="utf-8"))
+def _parse_streams(text: str) -> list[StreamConfig]:
+    data = tomllib.loads(text)
 
     streams: list[StreamConfig] = []
     for raw_stream in data.get("streams", []):
@@ -120,31 +190,358 @@ def load_streams(path: Path) -> list[StreamConfig]:
                     channel_id = None
 
             subscribers.append(
-                Subscriber(user_id=user_id, delivery=delivery, channel_id=channel_id)
+                Subscriber(
+                    user_id=user_id,
+                    delivery=delivery,
+                    channel_id=channel_id,
+                    digest=raw_subscriber.get("digest") is True,
+                )
             )
 
-        streams.append(StreamConfig(name=name, script=script, subscribers=subscribers))
+        timeout: float | None
+        try:
+            timeout = float(raw_stream["timeout"]) if "timeout" in raw_stream else None
+        except (TypeError, ValueError):
+            timeout = None
+
+        schedule: str | None = None
+        if "schedule" in raw_stream:
+            schedule = str(raw_stream["schedule"]).strip()
+            try:
+                schedules.parse_schedule(schedule)
+            except ValueError as exc:
+                print(f"Ignoring schedule for stream {name}: {exc}")
+                schedule = None
+
+        jitter: float | None
+        try:
+            jitter = float(raw_stream["jitter"]) if "jitter" in raw_stream else None
+        except (TypeError, ValueError):
+            jitter = None
+
+        streams.append(
+            StreamConfig(
+                name=name,
+                script=script,
+                subscribers=subscribers,
+                timeout=timeout,
+                schedule=schedule,
+                jitter=jitter,
+            )
+        )
 
     return streams
 
 
+def _write_atomic(path: Path, text: str):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def _mtime_ns(path: Path) -> int | None:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class StreamRegistry:
+    """The streams in one config file, parsed once and indexed in memory.
+
+    The file is reread only when its mtime changes (someone edited it by
+    hand). Changes made through the registry are written back atomically
+    after ``WRITE_DELAY_SECONDS``, so a burst of signups costs one write.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.streams: list[StreamConfig] = []
+        self._by_name: dict[str, StreamConfig] = {}
+        self._by_user: dict[int, dict[str, Subscriber]] = {}
+        self._mtime: int | None = None
+        self._dirty = False
+        self._writer: asyncio.Task | None = None
+        self._load()
+
+    def _load(self):
+        _ensure_config_file(self.path)
+        self._mtime = _mtime_ns(self.path)
+        self._index(_parse_streams(self.path.read_text(encoding="utf-8")))
+
+    def _index(self, streams: list[StreamConfig]):
+        self.streams = streams
+        self._by_name = {}
+        self._by_user = {}
+        for stream in streams:
+            key = stream.name.lower()
+            self._by_name.setdefault(key, stream)
+            for sub in stream.subscribers:
+                self._by_user.setdefault(sub.user_id, {})[key] = sub
+
+    def refresh(self):
+        """Reload from disk if the file changed and nothing is waiting to be written."""
+        if self._dirty:
+            return
+        if _mtime_ns(self.path) != self._mtime:
+            self._load()
+
+    def find(self, stream_name: str) -> StreamConfig | None:
+        self.refresh()
+        return self._by_name.get(stream_name.strip().lower())
+
+    def subscriptions(self, user_id: int) -> dict[str, Subscriber]:
+        """Return ``{lowercase stream name: Subscriber}`` for ``user_id``."""
+        self.refresh()
+        return dict(self._by_user.get(user_id, {}))
+
+    def upsert(self, stream: StreamConfig, sub: Subscriber):
+        key = stream.name.lower()
+        existing = self._by_user.get(sub.user_id, {}).get(key)
+        if existing is None:
+            stream.subscribers.append(sub)
+            self._by_user.setdefault(sub.user_id, {})[key] = sub
+        else:
+            existing.delivery = sub.delivery
+            existing.channel_id = sub.channel_id
+            existing.digest = sub.digest
+        self.schedule_write()
+
+    def remove(self, stream: StreamConfig, user_id: int) -> bool:
+        key = stream.name.lower()
+        subs = self._by_user.get(user_id)
+        if subs is None or subs.pop(key, None) is None:
+            return False
+        if not subs:
+            del self._by_user[user_id]
+        stream.subscribers = [s for s in stream.subscribers if s.user_id != user_id]
+        self.schedule_write()
+        return True
+
+    def replace(self, streams: list[StreamConfig]):
+        """Swap in a whole new set of streams and write them out immediately."""
+        self._index(streams)
+        self._dirty = False
+        _write_atomic(self.path, _dump_streams(streams))
+        self._mtime = _mtime_ns(self.path)
+
+    def schedule_write(self):
+        self._dirty = True
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._write_later())
+
+    async def _write_later(self):
+        await asyncio.sleep(WRITE_DELAY_SECONDS)
+        while self._dirty:
+            self._dirty = False
+            text = _dump_streams(self.streams)
+            await asyncio.to_thread(_write_atomic, self.path, text)
+            self._mtime = _mtime_ns(self.path)
+
+    async def flush(self):
+        """Wait for any pending write to reach disk."""
+        if self._writer is not None:
+            await self._writer
+
+
+class SqliteStreamStore:
+    """Streams and subscribers in SQLite, with the same interface as StreamRegistry.
+
+    Subscriptions are single indexed rows, so a signup or unsubscribe is one
+    upsert or delete however many subscribers the other streams have.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS streams (
+                name TEXT PRIMARY KEY COLLATE NOCASE,
+                script TEXT NOT NULL,
+                timeout REAL,
+                schedule TEXT,
+                jitter REAL
+            );
+            CREATE TABLE IF NOT EXISTS subscribers (
+                stream TEXT NOT NULL COLLATE NOCASE
+                    REFERENCES streams (name) ON DELETE CASCADE,
+                user_id INTEGER NOT NULL,
+                delivery TEXT NOT NULL,
+                channel_id INTEGER,
+                digest INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (stream, user_id)
+            );
+            CREATE INDEX IF NOT EXISTS subscribers_user ON subscribers (user_id);
+            """
+        )
+        # Databases created by older versions lack the newer columns.
+        for table, column, kind in (
+            ("streams", "schedule", "TEXT"),
+            ("streams", "jitter", "REAL"),
+            ("subscribers", "digest", "INTEGER NOT NULL DEFAULT 0"),
+        ):
+            columns = {row[1] for row in self._db.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+    def _stream(self, row) -> StreamConfig:
+        name, script, timeout, schedule, jitter = row
+        subscribers = [
+            Subscriber(
+                user_id=user_id, delivery=delivery, channel_id=channel_id, digest=bool(digest)
+            )
+            for user_id, delivery, channel_id, digest in self._db.execute(
+                "SELECT user_id, delivery, channel_id, digest FROM subscribers"
+                " WHERE stream = ? ORDER BY rowid",
+                (name,),
+            )
+        ]
+        return StreamConfig(
+            name=name,
+            script=Path(script),
+            subscribers=subscribers,
+            timeout=timeout,
+            schedule=schedule,
+            jitter=jitter,
+        )
+
+    @property
+    def streams(self) -> list[StreamConfig]:
+        rows = self._db.execute(
+            "SELECT name, script, timeout, schedule, jitter FROM streams ORDER BY rowid"
+        )
+        return [self._stream(row) for row in rows.fetchall()]
+
+    def refresh(self):
+        pass
+
+    def find(self, stream_name: str) -> StreamConfig | None:
+        row = self._db.execute(
+            "SELECT name, script, timeout, schedule, jitter FROM streams WHERE name = ?",
+            (stream_name.strip(),),
+        ).fetchone()
+        return self._stream(row) if row is not None else None
+
+    def subscriptions(self, user_id: int) -> dict[str, Subscriber]:
+        rows = self._db.execute(
+            "SELECT stream, delivery, channel_id, digest FROM subscribers WHERE user_id = ?",
+            (user_id,),
+        )
+        return {
+            stream.lower(): Subscriber(
+                user_id=user_id, delivery=delivery, channel_id=channel_id, digest=bool(digest)
+            )
+            for stream, delivery, channel_id, digest in rows
+        }
+
+    def upsert(self, stream: StreamConfig, sub: Subscriber):
+        self._db.execute(
+            "INSERT INTO subscribers (stream, user_id, delivery, channel_id, digest)"
+            " VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (stream, user_id) DO UPDATE SET"
+            " delivery = excluded.delivery, channel_id = excluded.channel_id,"
+            " digest = excluded.digest",
+            (stream.name, sub.user_id, sub.delivery, sub.channel_id, sub.digest),
+        )
+
+    def remove(self, stream: StreamConfig, user_id: int) -> bool:
+        cursor = self._db.execute(
+            "DELETE FROM subscribers WHERE stream = ? AND user_id = ?",
+            (stream.name, user_id),
+        )
+        return cursor.rowcount > 0
+
+    def replace(self, streams: list[StreamConfig]):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM streams")
+            for stream in streams:
+                # Names are unique ignoring case; like find(), the first wins.
+                inserted = self._db.execute(
+                    "INSERT OR IGNORE INTO streams (name, script, timeout, schedule, jitter)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (
+                        stream.name,
+                        stream.script.as_posix(),
+                        stream.timeout,
+                        stream.schedule,
+                        stream.jitter,
+                    ),
+                ).rowcount
+                if not inserted:
+                    continue
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO subscribers"
+                    " (stream, user_id, delivery, channel_id, digest) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (stream.name, sub.user_id, sub.delivery, sub.channel_id, sub.digest)
+                        for sub in stream.subscribers
+                    ],
+                )
+
+    async def flush(self):
+        pass
+
+
+_REGISTRIES: dict[Path, StreamRegistry | SqliteStreamStore] = {}
+
+
+def get_registry(path: Path) -> StreamRegistry | SqliteStreamStore:
+    key = path.resolve()
+    registry = _REGISTRIES.get(key)
+    if registry is None:
+        if path.suffix in SQLITE_SUFFIXES:
+            registry = SqliteStreamStore(path)
+        else:
+            registry = StreamRegistry(path)
+        _REGISTRIES[key] = registry
+    return registry
+
+
+def import_toml_streams(toml_path: Path, db_path: Path) -> tuple[int, int]:
+    """Copy every stream in a TOML config into a SQLite store, replacing its contents.
+
+    Returns (streams, subscribers) imported.
+    """
+    streams = _parse_streams(toml_path.read_text(encoding="utf-8"))
+    # Scripts are resolved relative to the config file, so keep them pointing
+    # at the same files if the database lives somewhere else.
+    if toml_path.parent.resolve() != db_path.parent.resolve():
+        for stream in streams:
+            if not stream.script.is_absolute():
+                stream.script = (toml_path.parent / stream.script).resolve()
+    store = get_registry(db_path)
+    if not isinstance(store, SqliteStreamStore):
+        raise ValueError(f"{db_path} is not a SQLite streams path")
+    store.replace(streams)
+    imported = store.streams
+    return len(imported), sum(len(stream.subscribers) for stream in imported)
+
+
+async def flush_registries():
+    """Persist every registry's pending changes; call before shutting down."""
+    for registry in _REGISTRIES.values():
+        await registry.flush()
+
+
 @kronicler.capture
-def write_streams(path: Path, streams: list[StreamConfig]):
-    path.write_text(_dump_streams(streams), encoding="utf-8")
+def load_streams(path: Path) -> list[StreamConfig]:
+    registry = get_registry(path)
+    registry.refresh()
+    return list(registry.streams)
 
 
 @kronicler.capture
-def list_stream_names(path: Path) -> list[str]:
-    return sorted(stream.name for stream in load_streams(path))
+def write_streams(path: Path, streams: list[StreamConfig]):
+    get_registry(path).replace(streams)
 
 
 @kronicler.capture
-def _find_stream(streams: list[StreamConfig], stream_name: str) -> StreamConfig | None:
-    lowered = stream_name.strip().lower()
-    for stream in streams:
-        if stream.name.lower() == lowered:
-            return stream
-    return None
+def list_stream_names(path: Path) -> list[str]:
+    return sorted(stream.name for stream in load_streams(path))
 
 
 @kronicler.capture
@@ -154,6 +551,7 @@ async def subscribe(
     user_id: int,
     delivery: str,
     channel_id: int | None,
+    digest: bool = False,
 ) -> tuple[bool, str]:
     delivery_mode = delivery.strip().lower()
     if delivery_mode not in {"dm", "channel"}:
@@ -162,47 +560,48 @@ async def subscribe(
     if delivery_mode == "channel" and channel_id is None:
         return False, "Channel delivery requires a channel ID."
 
-    async with _write_lock:
-        streams = load_streams(path)
-        stream = _find_stream(streams, stream_name)
-        if stream is None:
-            return False, f"Unknown stream `{stream_name}`."
-
-        existing = next((s for s in stream.subscribers if s.user_id == user_id), None)
-        if existing is None:
-            stream.subscribers.append(
-                Subscriber(user_id=user_id, delivery=delivery_mode, channel_id=channel_id)
-            )
-        else:
-            existing.delivery = delivery_mode
-            existing.channel_id = channel_id
-
-        write_streams(path, streams)
+    registry = get_registry(path)
+    stream = registry.find(stream_name)
+    if stream is None:
+        return False, f"Unknown stream `{stream_name}`."
 
-    return True, f"Subscribed to `{stream.name}` via `{delivery_mode}`."
+    registry.upsert(
+        stream,
+        Subscriber(
+            user_id=user_id, delivery=delivery_mode, channel_id=channel_id, digest=digest
+        ),
+    )
+    mode = " as a digest" if digest else ""
+    return True, f"Subscribed to `{stream.name}` via `{delivery_mode}`{mode}."
 
 
 @kronicler.capture
 async def unsubscribe(path: Path, stream_name: str, user_id: int) -> tuple[bool, str]:
-    async with _write_lock:
-        streams = load_streams(path)
-        stream = _find_stream(streams, stream_name)
-        if stream is None:
-            return False, f"Unknown stream `{stream_name}`."
-
-        before = len(stream.subscribers)
-        stream.subscribers = [s for s in stream.subscribers if s.user_id != user_id]
-        if len(stream.subscribers) == before:
-            return False, f"You are not subscribed to `{stream.name}`."
+    registry = get_registry(path)
+    stream = registry.find(stream_name)
+    if stream is None:
+        return False, f"Unknown stream `{stream_name}`."
 
-        write_streams(path, streams)
+    if not registry.remove(stream, user_id):
+        return False, f"You are not subscribed to `{stream.name}`."
 
     return True, f"Unsubscribed from `{stream.name}`."
 
 
-@kronicler.capture
-def load_stream_module(path: Path) -> ModuleType:
-    module_name = f"notification_stream_{path.stem}_{abs(hash(path.resolve()))}"
+@dataclass(slots=True)
+class LoadedScript:
+    module: ModuleType
+    mtime_ns: int
+    digest: str
+    load_seconds: float
+
+
+_MODULES: dict[Path, LoadedScript] = {}
+_LOAD_TIMES: dict[str, float] = {}
+
+
+def _exec_stream_module(path: Path) -> ModuleType:
+    module_name = f"notification_stream_{path.stem}_{abs(hash(path))}"
     spec = spec_from_file_location(module_name, path)
     if spec is None or spec.loader is None:
         raise RuntimeError(f"Unable to load stream script: {path}")
@@ -212,6 +611,36 @@ def load_stream_module(path: Path) -> ModuleType:
     return module
 
 
+@kronicler.capture
+def load_stream_module(path: Path) -> ModuleType:
+    """Return the module for a stream script, executing it only when it changed.
+
+    Scripts stay loaded between runs, so their imports and any module-level
+    state (sessions, connections) are reused. A script is re-executed when
+    its mtime changes and its contents hash differently.
+    """
+    path = path.resolve()
+    mtime_ns = path.stat().st_mtime_ns
+    cached = _MODULES.get(path)
+    if cached is not None and cached.mtime_ns == mtime_ns:
+        return cached.module
+
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    if cached is not None and cached.digest == digest:
+        cached.mtime_ns = mtime_ns
+        return cached.module
+
+    started = perf_counter()
+    module = _exec_stream_module(path)
+    _MODULES[path] = LoadedScript(module, mtime_ns, digest, perf_counter() - started)
+    return module
+
+
+def script_load_times() -> dict[str, float]:
+    """Seconds each stream's script took to execute when it was last (re)loaded."""
+    return dict(_LOAD_TIMES)
+
+
 @kronicler.capture
 def _event_to_content(stream_name: str, event: Any) -> tuple[str, str | None]:
     """Return (display_text, url_or_None). URL is always stripped from display text."""
@@ -232,25 +661,59 @@ def _event_to_content(stream_name: str, event: Any) -> tuple[str, str | None]:
     return f"{prefix} {event}", None
 
 
-async def _fetch_og_data(url: str) -> dict[str, str | None]:
-    """Return og:title and og:image scraped from url, or None for each if missing."""
-    def _og_match(html: str, prop: str) -> str | None:
-        m = re.search(
-            rf'<meta[^>]+property=["\']og:{prop}["\'][^>]+content=["\']([^"\']+)["\']'
-            rf'|<meta[^>]+content=["\']([^"\']+)["\'][^>]+property=["\']og:{prop}["\']',
-            html,
-        )
-        return (m.group(1) or m.group(2)) if m else None
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, discord.RateLimited):
+        return True
+    return isinstance(exc, discord.HTTPException) and (
+        exc.status == 429 or exc.status >= 500
+    )
+
 
+async def _with_retries(
+    call: Callable[[], Awaitable[Any]], stats: DeliveryStats | None = None
+) -> Any:
+    """Await ``call()``, retrying rate limits and server errors with backoff."""
+    for attempt in range(DELIVERY_RETRIES + 1):
+        try:
+            return await call()
+        except Exception as exc:
+            if attempt == DELIVERY_RETRIES or not _is_retryable(exc):
+                raise
+            delay = RETRY_BASE_SECONDS * 2**attempt + random.uniform(0, RETRY_BASE_SECONDS)
+            if isinstance(exc, discord.RateLimited):
+                delay = max(delay, exc.retry_after)
+            if stats is not None:
+                stats.retries += 1
+            await asyncio.sleep(delay)
+
+
+async def _dm_channel(bot: discord.Client, user_id: int) -> discord.DMChannel:
+    """Return the DM channel for ``user_id``, only hitting the API on a cache miss."""
+    channel = _DM_CHANNELS.get(user_id)
+    if channel is not None:
+        return channel
+
+    user = bot.get_user(user_id)
+    if user is None:
+        user = await _with_retries(lambda: bot.fetch_user(user_id))
+    channel = user.dm_channel
+    if channel is None:
+        channel = await _with_retries(user.create_dm)
+    _DM_CHANNELS[user_id] = channel
+    return channel
+
+
+async def _send_dm(
+    bot: discord.Client, user_id: int, content: str, stats: DeliveryStats | None = None
+) -> discord.DMChannel:
+    channel = await _dm_channel(bot, user_id)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                if resp.status != 200:
-                    return {"title": None, "image": None}
-                html = await resp.text()
-        return {"title": _og_match(html, "title"), "image": _og_match(html, "image")}
-    except Exception:
-        return {"title": None, "image": None}
+        await _with_retries(lambda: channel.send(content), stats)
+    except (discord.Forbidden, discord.NotFound):
+        # The DM channel may have gone away; look it up afresh next time.
+        _DM_CHANNELS.pop(user_id, None)
+        raise
+    return channel
 
 
 @kronicler.capture
@@ -258,13 +721,17 @@ async def _send_to_subscriber(
     bot: discord.Client,
     sub: Subscriber,
     content: str,
-    embed: discord.Embed | None = None,
+    embeds: list[discord.Embed] | None = None,
     url: str | None = None,
+    stats: DeliveryStats | None = None,
 ):
+    """Send one message to ``sub``.
+
+    ``url`` is appended for DM delivery; in a channel it is held back and
+    DMed to whoever reacts with 👍.
+    """
     if sub.delivery == "dm":
-        user = await bot.fetch_user(sub.user_id)
-        dm_content = f"{content}\n{url}" if url else content
-        await user.send(dm_content)
+        await _send_dm(bot, sub.user_id, f"{content}\n{url}" if url else content, stats)
         return
 
     if sub.channel_id is None:
@@ -274,18 +741,230 @@ async def _send_to_subscriber(
 
     channel = bot.get_channel(sub.channel_id)
     if channel is None:
-        channel = await bot.fetch_channel(sub.channel_id)
+        channel = await _with_retries(lambda: bot.fetch_channel(sub.channel_id), stats)
 
     if not isinstance(channel, discord.abc.Messageable):
         raise RuntimeError(f"Channel {sub.channel_id} is not messageable")
 
-    msg = await channel.send(
-        f"<@{sub.user_id}> {content}",
-        embed=embed,
+    # Retry the send and the reaction separately so a failed reaction never
+    # re-posts the message.
+    msg = await _with_retries(
+        lambda: channel.send(f"<@{sub.user_id}> {content}", embeds=embeds or []), stats
     )
     if url:
-        _PENDING_LINKS[msg.id] = url
-        await msg.add_reaction("👍")
+        pending_links.get_store().put(msg.id, url)
+        await _with_retries(lambda: msg.add_reaction("👍"), stats)
+
+
+@dataclass(slots=True)
+class DigestMessage:
+    content: str
+    embeds: list[discord.Embed]
+    urls: list[str]
+    events: int = 0
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def pack_digest(
+    items: list[tuple[str, discord.Embed | None, str | None]], budget: int
+) -> list[DigestMessage]:
+    """Greedily pack ``(text, embed, url)`` items into as few messages as possible.
+
+    Each message's text stays within ``budget`` characters, carries at most
+    DIGEST_MAX_EMBEDS embeds, and its URLs joined by newlines fit in one
+    message of their own (they are DMed together on a 👍).
+    """
+    messages: list[DigestMessage] = []
+    current = DigestMessage("", [], [])
+    url_chars = 0
+    for text, embed, url in items:
+        text = _truncate(text, budget)
+        separator = "\n\n" if current.events else ""
+        url_cost = len(url) + 1 if url else 0
+        if current.events and (
+            len(current.content) + len(separator) + len(text) > budget
+            or (embed is not None and len(current.embeds) == DIGEST_MAX_EMBEDS)
+            or url_chars + url_cost > DIGEST_MESSAGE_CHARS
+        ):
+            messages.append(current)
+            current = DigestMessage("", [], [])
+            url_chars = 0
+            separator = ""
+        current.content += separator + text
+        current.events += 1
+        if embed is not None:
+            current.embeds.append(embed)
+        if url:
+            current.urls.append(url)
+            url_chars += url_cost
+    if current.events:
+        messages.append(current)
+    return messages
+
+
+class Delivery:
+    """Fans messages out to subscribers with a shared concurrency limit."""
+
+    def __init__(self, bot: discord.Client, concurrency: int = DELIVERY_CONCURRENCY):
+        self.bot = bot
+        self.stats = DeliveryStats()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._started = perf_counter()
+
+    async def _send_one(
+        self,
+        sub: Subscriber,
+        content: str,
+        embed: discord.Embed | None,
+        url: str | None,
+        label: str,
+    ) -> bool:
+        async with self._semaphore:
+            try:
+                await _send_to_subscriber(
+                    self.bot,
+                    sub,
+                    content,
+                    embeds=[embed] if embed is not None else None,
+                    url=url,
+                    stats=self.stats,
+                )
+            except Exception as exc:
+                self.stats.failed += 1
+                print(f"Failed to send {label} to {sub.user_id}: {exc}")
+                return False
+        self.stats.sent += 1
+        return True
+
+    async def send(
+        self,
+        subscribers: list[Subscriber],
+        content: str,
+        embed: discord.Embed | None = None,
+        url: str | None = None,
+        label: str = "notification",
+    ) -> int:
+        """Send one message to every subscriber; return how many succeeded."""
+        results = await asyncio.gather(
+            *(self._send_one(sub, content, embed, url, label) for sub in subscribers)
+        )
+        return sum(results)
+
+    async def _send_digest_to(
+        self,
+        sub: Subscriber,
+        items: list[tuple[str, str | None, str | None]],
+        label: str,
+    ) -> int:
+        if sub.delivery == "dm":
+            # DMs carry their links inline and no embeds, as single events do.
+            packed = pack_digest(
+                [(f"{text}\n{url}" if url else text, None, None) for text, url, _ in items],
+                DIGEST_MESSAGE_CHARS,
+            )
+        else:
+            mention = f"<@{sub.user_id}> "
+            budget = DIGEST_MESSAGE_CHARS - len(mention) - len(DIGEST_LINK_NOTE) - 2
+            packed = pack_digest(
+                [(text, _digest_embed(text, image), url) for text, url, image in items],
+                budget,
+            )
+
+        delivered = 0
+        for message in packed:
+            content = message.content
+            if message.urls:
+                content += f"\n\n{DIGEST_LINK_NOTE}"
+            async with self._semaphore:
+                try:
+                    await _send_to_subscriber(
+                        self.bot,
+                        sub,
+                        content,
+                        embeds=message.embeds,
+                        url="\n".join(message.urls) or None,
+                        stats=self.stats,
+                    )
+                except Exception as exc:
+                    self.stats.failed += 1
+                    print(f"Failed to send {label} digest to {sub.user_id}: {exc}")
+                    continue
+            self.stats.sent += 1
+            delivered += message.events
+        return delivered
+
+    async def send_digest(
+        self,
+        subscribers: list[Subscriber],
+        items: list[tuple[str, str | None, str | None]],
+        label: str = "notification",
+    ) -> int:
+        """Send ``(text, url, image)`` items to each digest subscriber, packed.
+
+        Returns how many events reached a subscriber, counting each
+        subscriber separately like ``send`` does.
+        """
+        results = await asyncio.gather(
+            *(self._send_digest_to(sub, items, label) for sub in subscribers)
+        )
+        return sum(results)
+
+    def finish(self) -> DeliveryStats:
+        self.stats.elapsed = perf_counter() - self._started
+        return self.stats
+
+
+def _digest_embed(text: str, image: str | None) -> discord.Embed | None:
+    if not image:
+        return None
+    embed = discord.Embed(title=_truncate(text.split("\n", 1)[0], 256))
+    embed.set_image(url=image)
+    return embed
+
+
+def last_delivery_stats() -> DeliveryStats | None:
+    """Stats from the most recent dispatch_notifications run."""
+    return _LAST_DELIVERY
+
+
+def request_link(message_id: int, user_id: int, url: str) -> bool:
+    """Queue a 👍 link DM; False if it was already sent or is already queued."""
+    key = (message_id, user_id)
+    if key in _QUEUED_LINKS or pending_links.get_store().delivered(message_id, user_id):
+        return False
+    try:
+        _LINK_REQUESTS.put_nowait((message_id, user_id, url))
+    except asyncio.QueueFull:
+        print(f"Link request queue full; dropping request from {user_id}")
+        return False
+    _QUEUED_LINKS.add(key)
+    return True
+
+
+async def _deliver_link(bot: discord.Client, message_id: int, user_id: int, url: str):
+    channel = await _send_dm(bot, user_id, url)
+    pending_links.get_store().mark_delivered(message_id, user_id)
+    user = bot.get_user(user_id) or channel.recipient
+    link_log.record(user_id, str(user) if user is not None else str(user_id), url)
+
+
+def create_link_request_worker(bot: discord.Client):
+    """Return a loop that DMs queued 👍 link requests one at a time."""
+
+    @tasks.loop(seconds=0)
+    async def link_request_worker():
+        message_id, user_id, url = await _LINK_REQUESTS.get()
+        try:
+            await _deliver_link(bot, message_id, user_id, url)
+        except Exception as exc:
+            print(f"Failed to DM link to {user_id}: {exc}")
+        finally:
+            _QUEUED_LINKS.discard((message_id, user_id))
+
+    return link_request_worker
 
 
 @kronicler.capture
@@ -299,12 +978,11 @@ async def send_url_to_stream(
 
     Returns (found, error_message, sent_count).
     """
-    streams = load_streams(path)
-    stream = _find_stream(streams, stream_name)
+    stream = get_registry(path).find(stream_name)
     if stream is None:
         return False, f"Unknown stream `{stream_name}`.", 0
 
-    og = await _fetch_og_data(url)
+    og = await opengraph.fetch_og_data(url)
     title = og["title"] or url
     content = f"[{stream.name}] {title}"
 
@@ -313,85 +991,266 @@ async def send_url_to_stream(
         embed.set_image(url=og["image"])
     embed.set_footer(text="React with 👍 to receive the link via DM")
 
-    sent = 0
-    for sub in stream.subscribers:
-        try:
-            await _send_to_subscriber(bot, sub, content, embed=embed, url=url)
-            sent += 1
-        except Exception as exc:
-            print(f"Failed to send manual notification to {sub.user_id}: {exc}")
-
+    delivery = Delivery(bot)
+    sent = await delivery.send(
+        stream.subscribers, content, embed=embed, url=url, label="manual notification"
+    )
+    print(f"Manual notification to {stream.name}: {delivery.finish().summary()}")
     return True, "", sent
 
 
-@kronicler.capture
-async def dispatch_notifications(
-    bot: discord.Client, path: Path = NOTIFICATION_STREAMS_PATH
-) -> dict[str, int]:
-    streams = load_streams(path)
-    sent: dict[str, int] = {}
+_END_OF_EVENTS = object()
 
-    for stream in streams:
-        script_path = stream.script
-        if not script_path.is_absolute():
-            script_path = (path.parent / script_path).resolve()
 
-        if not script_path.exists():
-            print(f"Notification stream script not found for {stream.name}: {script_path}")
-            continue
+async def _events(pull: Callable[[], Any]) -> AsyncIterator[Any]:
+    """Yield the events from a stream's get_new_events, whatever its shape.
 
-        try:
-            module = load_stream_module(script_path)
-        except Exception as exc:
-            print(f"Failed to load stream script {script_path}: {exc}")
-            continue
+    Scripts may return a list (or any iterable), be a generator, be ``async``
+    and return a list or async iterator, or be an async generator. Blocking
+    calls into synchronous scripts, including each step of a generator, run
+    on a worker thread so the event loop keeps moving.
+    """
+    if inspect.isasyncgenfunction(pull):
+        result = pull()
+    elif inspect.iscoroutinefunction(pull):
+        result = await pull()
+    else:
+        result = await asyncio.to_thread(pull)
+
+    if result is None:
+        return
+    if hasattr(result, "__aiter__"):
+        async for event in result:
+            yield event
+    elif isinstance(result, (list, tuple)):
+        for event in result:
+            yield event
+    else:
+        iterator = iter(result)
+        while True:
+            event = await asyncio.to_thread(next, iterator, _END_OF_EVENTS)
+            if event is _END_OF_EVENTS:
+                return
+            yield event
 
-        pull = getattr(module, "get_new_events", None)
-        if pull is None:
-            print(f"Stream script {script_path} does not define get_new_events()")
-            continue
 
+@kronicler.capture
+async def _run_stream(delivery: Delivery, path: Path, stream: StreamConfig) -> int | None:
+    """Pull and deliver one stream's events; None if the stream was skipped."""
+    script_path = stream.script
+    if not script_path.is_absolute():
+        script_path = path.parent / script_path
+    script_path = script_path.resolve()
+
+    if not script_path.exists():
+        print(f"Notification stream script not found for {stream.name}: {script_path}")
+        return None
+
+    previous = _MODULES.get(script_path)
+    try:
+        module = load_stream_module(script_path)
+    except Exception as exc:
+        print(f"Failed to load stream script {script_path}: {exc}")
+        return None
+
+    loaded = _MODULES[script_path]
+    if loaded is not previous:
+        print(f"Loaded stream script for {stream.name} in {loaded.load_seconds:.3f}s")
+    # Streams sharing a script share its load time.
+    _LOAD_TIMES[stream.name] = loaded.load_seconds
+
+    pull = getattr(module, "get_new_events", None)
+    if pull is None:
+        print(f"Stream script {script_path} does not define get_new_events()")
+        return None
+
+    timeout = stream.timeout if stream.timeout is not None else STREAM_TIMEOUT_SECONDS
+    queue: asyncio.Queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+    previews: dict[str, asyncio.Task] = {}
+    failed = False
+
+    async def produce():
+        nonlocal failed
+        source = _events(pull)
+        remaining = timeout
+        cancelled = False
         try:
-            events = pull()
+            while True:
+                # Only time spent waiting on the script counts towards its
+                # timeout, not time spent delivering what it already yielded.
+                started = perf_counter()
+                try:
+                    event = await asyncio.wait_for(anext(source), remaining)
+                except StopAsyncIteration:
+                    break
+                remaining -= perf_counter() - started
+
+                content, url = _event_to_content(stream.name, event)
+                # Start the preview fetch now so it overlaps with delivery of
+                # the events ahead of this one.
+                if url and url not in previews:
+                    previews[url] = asyncio.create_task(opengraph.fetch_og_data(url))
+                await queue.put((content, url))
+        except asyncio.TimeoutError:
+            failed = True
+            print(f"get_new_events() for stream {stream.name} timed out after {timeout}s")
         except Exception as exc:
+            failed = True
             print(f"Error calling get_new_events() for stream {stream.name}: {exc}")
-            continue
-
-        if not events:
-            sent[stream.name] = 0
-            continue
-
-        sent_count = 0
-        for event in events:
-            content, url = _event_to_content(stream.name, event)
-
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            await source.aclose()
+            # Once cancelled nothing reads the queue, so a full one would
+            # never make room for the end marker.
+            if not cancelled:
+                await queue.put(_END_OF_EVENTS)
+
+    immediate = [sub for sub in stream.subscribers if not sub.digest]
+    digest = [sub for sub in stream.subscribers if sub.digest]
+    digest_items: list[tuple[str, str | None, str | None]] = []
+    label = f"stream {stream.name} notification"
+
+    producer = asyncio.create_task(produce())
+    received = 0
+    sent_count = 0
+    try:
+        while (item := await queue.get()) is not _END_OF_EVENTS:
+            received += 1
+            content, url = item
+            image: str | None = None
             embed: discord.Embed | None = None
             if url:
-                og = await _fetch_og_data(url)
+                og = await previews[url]
+                image = og["image"]
                 embed = discord.Embed()
-                if og["image"]:
-                    embed.set_image(url=og["image"])
+                if image:
+                    embed.set_image(url=image)
                 embed.set_footer(text="React with 👍 to receive the link via DM")
 
-            for sub in stream.subscribers:
-                try:
-                    await _send_to_subscriber(bot, sub, content, embed=embed, url=url)
-                    sent_count += 1
-                except Exception as exc:
-                    print(
-                        f"Failed to send stream {stream.name} notification to {sub.user_id}: {exc}"
-                    )
+            if immediate:
+                sent_count += await delivery.send(
+                    immediate, content, embed=embed, url=url, label=label
+                )
+            if digest:
+                digest_items.append((content, url, image))
+    finally:
+        producer.cancel()
+
+    # Digest subscribers get everything from this run at once, packed.
+    if digest_items:
+        sent_count += await delivery.send_digest(digest, digest_items, label=label)
+
+    # A script that failed before producing anything is skipped, as before;
+    # events it yielded before failing have already been delivered.
+    if failed and not received:
+        return None
+    return sent_count
+
 
-        sent[stream.name] = sent_count
+@kronicler.capture
+async def dispatch_notifications(
+    bot: discord.Client,
+    path: Path = NOTIFICATION_STREAMS_PATH,
+    concurrency: int = STREAM_CONCURRENCY,
+) -> dict[str, int]:
+    global _LAST_DELIVERY
+
+    streams = load_streams(path)
+    semaphore = asyncio.Semaphore(concurrency)
+    delivery = Delivery(bot)
 
+    async def run(stream: StreamConfig) -> int | None:
+        async with semaphore, _stream_lock(stream.name):
+            try:
+                return await _run_stream(delivery, path, stream)
+            except Exception as exc:
+                # One broken stream must not stop the others from delivering.
+                print(f"Notification stream {stream.name} failed: {exc!r}")
+                return None
+
+    results = await asyncio.gather(*(run(stream) for stream in streams))
+    _LAST_DELIVERY = delivery.finish()
+    print(f"Notification dispatch: {_LAST_DELIVERY.summary()}")
+
+    sent: dict[str, int] = {}
+    for stream, count in zip(streams, results):
+        if count is not None:
+            sent[stream.name] = count
     return sent
 
 
-def create_daily_notification_check(
+def _stream_lock(stream_name: str) -> asyncio.Lock:
+    return _STREAM_LOCKS.setdefault(stream_name.lower(), asyncio.Lock())
+
+
+def _next_run(stream: StreamConfig, now: datetime, first: bool) -> datetime:
+    schedule = schedules.parse_schedule(stream.schedule or DEFAULT_SCHEDULE)
+    if first and isinstance(schedule, schedules.Interval):
+        # Start interval streams at a random point in their first interval so
+        # a restart doesn't fire them all at once.
+        at = now + timedelta(seconds=random.uniform(0, schedule.seconds))
+    else:
+        at = schedule.next_after(now)
+    jitter = stream.jitter if stream.jitter is not None else SCHEDULE_JITTER_SECONDS
+    return at + timedelta(seconds=random.uniform(0, jitter))
+
+
+def create_notification_scheduler(
     bot: discord.Client, path: Path = NOTIFICATION_STREAMS_PATH
 ):
-    @tasks.loop(time=time(hour=12, minute=5, tzinfo=MY_TIMEZONE))
-    async def daily_notification_check():
-        await dispatch_notifications(bot, path)
+    """Return a loop that runs each stream when its own schedule comes due."""
+    # A None run time marks a schedule that failed; it is retried once edited.
+    due: dict[str, tuple[str, datetime | None]] = {}
+    running: dict[str, asyncio.Task] = {}
+    slots = asyncio.Semaphore(STREAM_CONCURRENCY)
+
+    async def run(stream: StreamConfig):
+        async with slots, _stream_lock(stream.name):
+            delivery = Delivery(bot)
+            try:
+                count = await _run_stream(delivery, path, stream)
+            except Exception as exc:
+                print(f"Scheduled run of {stream.name} failed: {exc!r}")
+                return
+            if count:
+                print(f"Scheduled run of {stream.name}: {delivery.finish().summary()}")
+
+    def tick():
+        now = datetime.now(MY_TIMEZONE)
+        streams = load_streams(path)
+        for stream in streams:
+            key = stream.name.lower()
+            spec = stream.schedule or DEFAULT_SCHEDULE
+            entry = due.get(key)
+            first = entry is None or entry[0] != spec
+            # A stream still running from its last slot stays due and starts
+            # again on the first tick after it finishes.
+            if not first and (entry[1] is None or now < entry[1] or key in running):
+                continue
+            try:
+                at = _next_run(stream, now, first=first)
+            except (ValueError, OverflowError) as exc:
+                print(f"Not scheduling stream {stream.name}: {exc}")
+                at = None
+            due[key] = (spec, at)
+            if first or at is None:
+                continue
+            task = asyncio.create_task(run(stream))
+            running[key] = task
+            task.add_done_callback(lambda _, key=key: running.pop(key, None))
+
+        for key in set(due) - {stream.name.lower() for stream in streams}:
+            del due[key]
+
+    @tasks.loop(seconds=SCHEDULER_TICK_SECONDS)
+    async def notification_scheduler():
+        # An exception escaping a tasks.loop stops it for good, so a bad hand
+        # edit to the streams file only costs the ticks until it is fixed.
+        try:
+            tick()
+        except Exception as exc:
+            print(f"Notification scheduler skipped a tick: {exc!r}")
 
-    return daily_notification_check
+    return notification_scheduler
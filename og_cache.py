@@ -0,0 +1,139 @@
+"""SQLite-backed cache of OpenGraph metadata, keyed by normalized URL.
+
+Successful lookups are kept for ``TTL_SECONDS`` and failed ones (non-200s,
+timeouts, connection errors) for ``NEGATIVE_TTL_SECONDS``, so a dead link is
+not retried by every stream that mentions it. Once the table holds more than
+``MAX_ENTRIES`` rows the least recently used ones are evicted.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+
+OG_CACHE_PATH = Path("og_cache.sqlite3")
+TTL_SECONDS = 7 * 24 * 3600
+NEGATIVE_TTL_SECONDS = 3600
+MAX_ENTRIES = 5000
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Returned by OGCache.get when a URL has no live entry (``None`` is a cached failure).
+MISSING = object()
+
+
+def normalize_url(url: str) -> str:
+    """Lowercase scheme and host, drop the fragment and any default port."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port is not None and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    if parts.username or parts.password:
+        host = f"{parts.netloc.rsplit('@', 1)[0]}@{host}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+@dataclass(slots=True)
+class CacheStats:
+    hits: int = 0
+    negative_hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evictions: int = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.negative_hits + self.misses
+
+    def summary(self, entries: int) -> str:
+        rate = (self.hits + self.negative_hits) / self.lookups if self.lookups else 0.0
+        return (
+            f"OpenGraph cache: {entries}/{MAX_ENTRIES} entries, "
+            f"{self.lookups} lookups, {rate:.0%} hit rate\n"
+            f"{self.hits} hits, {self.negative_hits} negative hits, "
+            f"{self.misses} misses ({self.expired} expired), {self.evictions} evicted"
+        )
+
+
+class OGCache:
+    def __init__(self, path: Path = OG_CACHE_PATH):
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS og ("
+            " url TEXT PRIMARY KEY,"
+            " data TEXT,"  # JSON metadata, NULL for a failed fetch
+            " expires_at REAL NOT NULL,"
+            " used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS og_used_at ON og (used_at)")
+        self._count = self._db.execute("SELECT COUNT(*) FROM og").fetchone()[0]
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, url: str):
+        """Return cached metadata, ``None`` for a cached failure, or ``MISSING``."""
+        key = normalize_url(url)
+        now = time.time()
+        row = self._db.execute(
+            "SELECT data, expires_at FROM og WHERE url = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.stats.misses += 1
+            return MISSING
+        data, expires_at = row
+        if expires_at <= now:
+            self.stats.misses += 1
+            self.stats.expired += 1
+            return MISSING
+
+        self._db.execute("UPDATE og SET used_at = ? WHERE url = ?", (now, key))
+        if data is None:
+            self.stats.negative_hits += 1
+            return None
+        self.stats.hits += 1
+        return json.loads(data)
+
+    def put(self, url: str, data: dict | None):
+        """Store ``data`` for ``url``; ``None`` records a failed fetch."""
+        key = normalize_url(url)
+        now = time.time()
+        ttl = TTL_SECONDS if data is not None else NEGATIVE_TTL_SECONDS
+        exists = self._db.execute("SELECT 1 FROM og WHERE url = ?", (key,)).fetchone()
+        self._db.execute(
+            "INSERT OR REPLACE INTO og (url, data, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, None if data is None else json.dumps(data), now + ttl, now),
+        )
+        if exists is None:
+            self._count += 1
+
+        if self._count > MAX_ENTRIES:
+            excess = self._count - MAX_ENTRIES
+            self._db.execute(
+                "DELETE FROM og WHERE url IN"
+                " (SELECT url FROM og ORDER BY used_at LIMIT ?)",
+                (excess,),
+            )
+            self._count -= excess
+            self.stats.evictions += excess
+
+    def summary(self) -> str:
+        return self.stats.summary(self._count)
+
+
+_cache: OGCache | None = None
+
+
+def get_cache() -> OGCache:
+    global _cache
+    if _cache is None:
+        _cache = OGCache()
+    return _cache
@@ -0,0 +1,113 @@
+"""Links waiting for a 👍 reaction on channel notifications.
+
+When a notification with a URL is posted in a channel, the URL is kept out of
+the message and stored here under the message id; reacting with 👍 DMs it.
+The mapping lives in SQLite so reactions on older messages keep working
+across restarts. Entries expire after ``TTL_SECONDS`` and the table never
+holds more than ``MAX_ENTRIES`` rows, dropping the least recently used.
+Who has already been sent each link is recorded alongside, so a repeated
+reaction is ignored without any API calls.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from pathlib import Path
+
+
+PENDING_LINKS_PATH = Path("pending_links.sqlite3")
+TTL_SECONDS = 30 * 24 * 3600
+MAX_ENTRIES = 10000
+
+
+class PendingLinks:
+    def __init__(self, path: Path = PENDING_LINKS_PATH):
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS links ("
+            " message_id INTEGER PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS links_created_at ON links (created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS links_used_at ON links (used_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            " message_id INTEGER NOT NULL,"
+            " user_id INTEGER NOT NULL,"
+            " PRIMARY KEY (message_id, user_id)) WITHOUT ROWID"
+        )
+        self._count = self._db.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def put(self, message_id: int, url: str):
+        now = time.time()
+        exists = self._db.execute(
+            "SELECT 1 FROM links WHERE message_id = ?", (message_id,)
+        ).fetchone()
+        self._db.execute(
+            "INSERT OR REPLACE INTO links (message_id, url, created_at, used_at)"
+            " VALUES (?, ?, ?, ?)",
+            (message_id, url, now, now),
+        )
+        if exists is None:
+            self._count += 1
+        self._evict(now)
+
+    def get(self, message_id: int) -> str | None:
+        """Return the link for ``message_id`` if it is still pending."""
+        now = time.time()
+        row = self._db.execute(
+            "SELECT url, created_at FROM links WHERE message_id = ?", (message_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, created_at = row
+        if created_at + TTL_SECONDS <= now:
+            return None
+        self._db.execute("UPDATE links SET used_at = ? WHERE message_id = ?", (now, message_id))
+        return url
+
+    def delivered(self, message_id: int, user_id: int) -> bool:
+        row = self._db.execute(
+            "SELECT 1 FROM deliveries WHERE message_id = ? AND user_id = ?",
+            (message_id, user_id),
+        ).fetchone()
+        return row is not None
+
+    def mark_delivered(self, message_id: int, user_id: int):
+        self._db.execute(
+            "INSERT OR IGNORE INTO deliveries (message_id, user_id) VALUES (?, ?)",
+            (message_id, user_id),
+        )
+
+    def _evict(self, now: float):
+        removed = self._db.execute(
+            "DELETE FROM links WHERE created_at < ?", (now - TTL_SECONDS,)
+        ).rowcount
+        if self._count - removed > MAX_ENTRIES:
+            removed += self._db.execute(
+                "DELETE FROM links WHERE message_id IN"
+                " (SELECT message_id FROM links ORDER BY used_at LIMIT ?)",
+                (self._count - removed - MAX_ENTRIES,),
+            ).rowcount
+        if removed:
+            self._count -= removed
+            self._db.execute(
+                "DELETE FROM deliveries WHERE message_id NOT IN (SELECT message_id FROM links)"
+            )
+
+
+_store: PendingLinks | None = None
+
+
+def get_store() -> PendingLinks:
+    global _store
+    if _store is None:
+        _store = PendingLinks()
+    return _store
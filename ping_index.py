@@ -0,0 +1,345 @@
+"""Per-guild member indexes backing /ping expression evaluation.
+
+Every member of a guild gets a dense bit position, so any group of members can
+be held as a plain Python ``int`` and combined with ``&``, ``|``, ``^`` and
+``~`` a machine word at a time. Only the final result of an expression is
+turned back into ``discord.Member`` objects.
+
+The index also keeps a mask per role, a lowercase role name lookup and a live
+"online" mask. These are updated from gateway events (see the ``on_*``
+functions at the bottom, wired up in ``main.py``), so resolving ``@here`` or
+a role operand never has to walk the guild's member or role lists. The same
+role data backs /ping autocomplete through ``MemberIndex.complete``.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Iterable, Iterator
+
+import discord
+
+COMPLETION_CACHE_SIZE = 256
+
+
+def _is_online(member: discord.Member) -> bool:
+    return member.status is not discord.Status.offline
+
+
+class MemberIndex:
+    """Dense ``member id -> bit position`` mapping for a single guild.
+
+    Positions freed by departing members are reused, so the masks stay about
+    as wide as the guild is large.
+    """
+
+    def __init__(self, guild: discord.Guild):
+        self.guild_id = guild.id
+        self._positions: dict[int, int] = {}
+        self._ids: list[int | None] = []
+        self._free: list[int] = []
+        self.everyone = 0
+        self.bots = 0
+        self.online = 0
+        # Bumped on every change to membership, roles or presence so cached
+        # expression results can tell when they have gone stale.
+        self.generation = 0
+        self._role_masks: dict[int, int] = {}
+        self._roles_by_name: dict[str, dict[int, discord.Role]] = {}
+        # Autocomplete data. Rankings use member counts, so it is rebuilt
+        # lazily on the first completion after any change to ``generation``.
+        self._completions_generation = -1
+        self._names: list[tuple[str, str, int]] | None = None
+        self._name_keys: list[str] = []
+        self._ranked: list[tuple[str, str, int]] = []
+        self._completions: OrderedDict[str, list[str]] = OrderedDict()
+
+        role_members: dict[int, list[discord.Member]] = {}
+        for role in guild.roles:
+            if not role.is_default():
+                self.add_role(role)
+                role_members[role.id] = []
+
+        for member in guild.members:
+            self._assign(member.id)
+            for role in member.roles:
+                if role.id in role_members:
+                    role_members[role.id].append(member)
+
+        self.everyone = self.mask(guild.members)
+        self.bots = self.mask(m for m in guild.members if m.bot)
+        self.online = self.mask(m for m in guild.members if _is_online(m))
+        for role_id, members in role_members.items():
+            self._role_masks[role_id] = self.mask(members)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def _assign(self, member_id: int) -> int:
+        position = self._free.pop() if self._free else len(self._ids)
+        if position == len(self._ids):
+            self._ids.append(member_id)
+        else:
+            self._ids[position] = member_id
+        self._positions[member_id] = position
+        return position
+
+    def add(self, member: discord.Member) -> int:
+        """Index ``member`` (if needed) and return its single-bit mask."""
+        self.generation += 1
+        position = self._positions.get(member.id)
+        if position is None:
+            position = self._assign(member.id)
+        bit = 1 << position
+        self.everyone |= bit
+        if member.bot:
+            self.bots |= bit
+        if _is_online(member):
+            self.online |= bit
+        for role in member.roles:
+            if role.id in self._role_masks:
+                self._role_masks[role.id] |= bit
+        return bit
+
+    def remove(self, member_id: int) -> int:
+        """Drop a member from the index and return the bit it used to own."""
+        position = self._positions.pop(member_id, None)
+        if position is None:
+            return 0
+        self.generation += 1
+        self._ids[position] = None
+        self._free.append(position)
+        bit = 1 << position
+        self.everyone &= ~bit
+        self.bots &= ~bit
+        self.online &= ~bit
+        for role_id, role_mask in self._role_masks.items():
+            if role_mask & bit:
+                self._role_masks[role_id] = role_mask & ~bit
+        return bit
+
+    def bit(self, member: discord.Member) -> int:
+        """Return the single-bit mask for ``member``, indexing it on first sight."""
+        position = self._positions.get(member.id)
+        if position is None:
+            return self.add(member)
+        return 1 << position
+
+    def mask(self, members: Iterable[discord.Member]) -> int:
+        """Pack an iterable of members into a bitmask in one pass."""
+        buffer = bytearray(len(self._ids) // 8 + 1)
+        for member in members:
+            position = self._positions.get(member.id)
+            if position is None:
+                position = self.add(member).bit_length() - 1
+            if position >> 3 >= len(buffer):
+                buffer.extend(bytes((position >> 3) - len(buffer) + 1))
+            buffer[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(buffer, "little")
+
+    def ids(self, mask: int) -> Iterator[int]:
+        """Yield the member ids whose bits are set in ``mask``."""
+        # Scanning the binary string with str.find keeps the walk in C and
+        # avoids repeated big-int shifts.
+        bits = format(mask, "b")[::-1]
+        position = bits.find("1")
+        while position != -1:
+            member_id = self._ids[position]
+            if member_id is not None:
+                yield member_id
+            position = bits.find("1", position + 1)
+
+    def members(self, mask: int, guild: discord.Guild) -> list[discord.Member]:
+        """Turn ``mask`` back into the guild's ``discord.Member`` objects."""
+        found = []
+        for member_id in self.ids(mask):
+            member = guild.get_member(member_id)
+            if member is not None:
+                found.append(member)
+        return found
+
+    def add_role(self, role: discord.Role):
+        self.generation += 1
+        self._roles_by_name.setdefault(role.name.lower(), {})[role.id] = role
+        self._role_masks.setdefault(role.id, 0)
+
+    def remove_role(self, role: discord.Role):
+        self.generation += 1
+        self._role_masks.pop(role.id, None)
+        self._forget_role_name(role)
+
+    def rename_role(self, before: discord.Role, after: discord.Role):
+        self.generation += 1
+        self._forget_role_name(before)
+        self._roles_by_name.setdefault(after.name.lower(), {})[after.id] = after
+
+    def _forget_role_name(self, role: discord.Role):
+        lowered = role.name.lower()
+        bucket = self._roles_by_name.get(lowered)
+        if bucket is None:
+            return
+        bucket.pop(role.id, None)
+        if not bucket:
+            del self._roles_by_name[lowered]
+
+    def role_named(self, lowered: str) -> discord.Role | None:
+        """Return the role whose lowercase name is ``lowered``, if any.
+
+        When several roles share a name the lowest one wins, the same role a
+        scan over ``guild.roles`` would have found first.
+        """
+        bucket = self._roles_by_name.get(lowered)
+        if not bucket:
+            return None
+        if len(bucket) == 1:
+            return next(iter(bucket.values()))
+        return min(bucket.values(), key=lambda r: (r.position, r.id))
+
+    def role_mask(self, role_id: int) -> int:
+        return self._role_masks.get(role_id, 0)
+
+    def _forget_completions(self):
+        self._names = None
+        self._completions.clear()
+
+    def _build_names(self):
+        names = [
+            ("here", "@here", self.online.bit_count()),
+            ("everyone", "@everyone", self.everyone.bit_count()),
+        ]
+        for lowered, bucket in self._roles_by_name.items():
+            for role in bucket.values():
+                names.append((lowered, role.name, self.role_mask(role.id).bit_count()))
+        names.sort()
+        self._names = names
+        self._name_keys = [lowered for lowered, _, _ in names]
+        self._ranked = sorted(names, key=lambda entry: (-entry[2], entry[0]))
+
+    def complete(self, search: str, limit: int = 25) -> list[str]:
+        """Return up to ``limit`` operand names containing ``search``.
+
+        Names starting with ``search`` come first, then the rest; each group
+        is ordered by member count, largest first.
+        """
+        if self._completions_generation != self.generation:
+            self._forget_completions()
+            self._completions_generation = self.generation
+
+        cached = self._completions.get(search)
+        if cached is not None:
+            self._completions.move_to_end(search)
+            return cached
+
+        if self._names is None:
+            self._build_names()
+
+        start = bisect_left(self._name_keys, search)
+        end = bisect_left(self._name_keys, search + "\U0010ffff", start)
+        prefixed = sorted(self._names[start:end], key=lambda entry: (-entry[2], entry[0]))
+        found = [name for _, name, _ in prefixed[:limit]]
+        if len(found) < limit and search:
+            for lowered, name, _ in self._ranked:
+                if search in lowered and not lowered.startswith(search):
+                    found.append(name)
+                    if len(found) == limit:
+                        break
+
+        self._completions[search] = found
+        if len(self._completions) > COMPLETION_CACHE_SIZE:
+            self._completions.popitem(last=False)
+        return found
+
+    def update_roles(self, before: discord.Member, after: discord.Member):
+        self.generation += 1
+        position = self._positions.get(after.id)
+        if position is None:
+            self.add(after)
+            return
+        bit = 1 << position
+        before_ids = {role.id for role in before.roles}
+        after_ids = {role.id for role in after.roles}
+        for role_id in before_ids - after_ids:
+            if role_id in self._role_masks:
+                self._role_masks[role_id] &= ~bit
+        for role_id in after_ids - before_ids:
+            if role_id in self._role_masks:
+                self._role_masks[role_id] |= bit
+
+    def update_presence(self, member: discord.Member):
+        self.generation += 1
+        position = self._positions.get(member.id)
+        if position is None:
+            self.add(member)
+            return
+        bit = 1 << position
+        if _is_online(member):
+            self.online |= bit
+        else:
+            self.online &= ~bit
+
+
+_INDEXES: dict[int, MemberIndex] = {}
+
+
+def get_index(guild: discord.Guild) -> MemberIndex:
+    """Return the member index for ``guild``, building it on first use."""
+    index = _INDEXES.get(guild.id)
+    if index is None:
+        index = MemberIndex(guild)
+        # Only keep the index once the member list is complete; a partial
+        # index would silently drop members from every later ping.
+        if guild.chunked:
+            _INDEXES[guild.id] = index
+    return index
+
+
+def is_stored(index: MemberIndex) -> bool:
+    """Whether ``index`` is the one kept up to date from gateway events."""
+    return _INDEXES.get(index.guild_id) is index
+
+
+def on_member_join(member: discord.Member):
+    index = _INDEXES.get(member.guild.id)
+    if index is not None:
+        index.add(member)
+
+
+def on_member_remove(member: discord.Member):
+    index = _INDEXES.get(member.guild.id)
+    if index is not None:
+        index.remove(member.id)
+
+
+def on_member_update(before: discord.Member, after: discord.Member):
+    index = _INDEXES.get(after.guild.id)
+    if index is not None and before.roles != after.roles:
+        index.update_roles(before, after)
+
+
+def on_presence_update(before: discord.Member, after: discord.Member):
+    index = _INDEXES.get(after.guild.id)
+    if index is not None and _is_online(before) != _is_online(after):
+        index.update_presence(after)
+
+
+def on_guild_role_create(role: discord.Role):
+    index = _INDEXES.get(role.guild.id)
+    if index is not None:
+        index.add_role(role)
+
+
+def on_guild_role_delete(role: discord.Role):
+    index = _INDEXES.get(role.guild.id)
+    if index is not None:
+        index.remove_role(role)
+
+
+def on_guild_role_update(before: discord.Role, after: discord.Role):
+    index = _INDEXES.get(after.guild.id)
+    if index is not None and before.name != after.name:
+        index.rename_role(before, after)
+
+
+def on_guild_remove(guild: discord.Guild):
+    _INDEXES.pop(guild.id, None)
@@ -0,0 +1,218 @@
+"""Simplification pass for /ping expression trees.
+
+Works on the plain tuples ``pinger.Parser`` produces and needs nothing from
+discord, so it can be exercised on its own::
+
+    >>> optimize(("!", ("!", ("operand", "@Mods"))))
+    ('operand', '@Mods')
+    >>> optimize(("&", ("operand", "@everyone"), ("operand", "@here")))
+    ('operand', '@here')
+
+Besides the parser's node kinds the output may contain two more:
+
+    ("none",)        the empty set
+    ("-", a, b)      members of ``a`` that are not in ``b`` (``a & !b``)
+
+Rewrites applied:
+
+* ``@everyone`` is folded away (``X & @everyone`` is ``X``, ``X | @everyone``
+  is ``@everyone``, ``!@everyone`` is empty, and so on).
+* ``!!X`` becomes ``X``; ``X & X``, ``X | X`` and ``X ^ X`` collapse, as do
+  ``X & !X`` and ``X | !X``.
+* De Morgan: complements are gathered and applied once, e.g.
+  ``!A & !B & C`` becomes ``C - (A | B)`` and ``!A | !B`` becomes
+  ``!(A & B)``.
+* Identical subtrees are shared, so an evaluator memoising on nodes computes
+  each one once.
+* ``&`` operands are ordered smallest first when an ``estimate`` callback is
+  given, so an empty intersection is found as early as possible.
+"""
+
+from __future__ import annotations
+
+from typing import Callable
+
+EVERYONE = ("operand", "@everyone")
+NOTHING = ("none",)
+
+Estimate = Callable[[str], "int | None"]
+
+
+def is_everyone(node) -> bool:
+    return node[0] == "operand" and node[1].lower() in ("@everyone", "everyone")
+
+
+def operands(node) -> list[str]:
+    """Return every operand value in ``node``, left to right."""
+    if node[0] == "operand":
+        return [node[1]]
+    found = []
+    for child in node[1:]:
+        found.extend(operands(child))
+    return found
+
+
+def optimize(node, estimate: Estimate | None = None):
+    """Return a simplified tree equivalent to ``node``."""
+    return _Optimizer(estimate).run(node)
+
+
+class _Optimizer:
+    def __init__(self, estimate: Estimate | None):
+        self.estimate = estimate
+        self.shared: dict[tuple, tuple] = {}
+
+    def run(self, node):
+        kind = node[0]
+        if kind == "operand":
+            return self._share(EVERYONE if is_everyone(node) else node)
+        if kind == "none":
+            return self._share(NOTHING)
+        if kind == "!":
+            return self._not(self.run(node[1]))
+        if kind == "&":
+            return self._and([self.run(node[1]), self.run(node[2])])
+        if kind == "|":
+            return self._or([self.run(node[1]), self.run(node[2])])
+        if kind == "^":
+            return self._xor(self.run(node[1]), self.run(node[2]))
+        if kind == "-":
+            return self._and([self.run(node[1]), self._not(self.run(node[2]))])
+        raise ValueError(f"Unknown operator {kind!r}.")
+
+    def _share(self, node):
+        return self.shared.setdefault(node, node)
+
+    def _not(self, node):
+        if node[0] == "!":
+            return node[1]
+        if node == EVERYONE:
+            return self._share(NOTHING)
+        if node == NOTHING:
+            return self._share(EVERYONE)
+        return self._share(("!", node))
+
+    def _and(self, items):
+        positives: list = []
+        negatives: list = []
+        pending = list(items)
+        while pending:
+            item = pending.pop(0)
+            kind = item[0]
+            if item == EVERYONE:
+                continue
+            if item == NOTHING:
+                return self._share(NOTHING)
+            if kind == "&":
+                pending[:0] = [item[1], item[2]]
+            elif kind == "-":
+                pending.insert(0, item[1])
+                negatives.append(item[2])
+            elif kind == "!":
+                negatives.append(item[1])
+            else:
+                positives.append(item)
+
+        positives = list(dict.fromkeys(positives))
+        negatives = list(dict.fromkeys(negatives))
+        if set(positives) & set(negatives):
+            return self._share(NOTHING)
+
+        excluded = self._or(negatives) if negatives else None
+        if excluded == EVERYONE:
+            return self._share(NOTHING)
+        if excluded == NOTHING:
+            excluded = None
+
+        if not positives:
+            return self._not(excluded) if excluded is not None else self._share(EVERYONE)
+
+        if self.estimate is not None:
+            positives.sort(key=self._size_key)
+        result = self._chain("&", positives)
+        if excluded is not None:
+            result = self._share(("-", result, excluded))
+        return result
+
+    def _or(self, items):
+        positives: list = []
+        negatives: list = []
+        pending = list(items)
+        while pending:
+            item = pending.pop(0)
+            kind = item[0]
+            if item == NOTHING:
+                continue
+            if item == EVERYONE:
+                return self._share(EVERYONE)
+            if kind == "|":
+                pending[:0] = [item[1], item[2]]
+            elif kind == "!":
+                negatives.append(item[1])
+            else:
+                positives.append(item)
+
+        positives = list(dict.fromkeys(positives))
+        negatives = list(dict.fromkeys(negatives))
+        if set(positives) & set(negatives):
+            return self._share(EVERYONE)
+
+        if negatives:
+            # !A | !B | P  ==  !((A & B) - P)
+            kept = self._and(negatives)
+            if positives:
+                kept = self._and([kept, self._not(self._or(positives))])
+            return self._not(kept)
+
+        if not positives:
+            return self._share(NOTHING)
+        return self._chain("|", positives)
+
+    def _xor(self, left, right):
+        flip = False
+        if left[0] == "!":
+            left, flip = left[1], not flip
+        if right[0] == "!":
+            right, flip = right[1], not flip
+
+        if left == right:
+            result = self._share(NOTHING)
+        elif left == NOTHING:
+            result = right
+        elif right == NOTHING:
+            result = left
+        elif left == EVERYONE:
+            result = self._not(right)
+        elif right == EVERYONE:
+            result = self._not(left)
+        else:
+            result = self._share(("^", left, right))
+        return self._not(result) if flip else result
+
+    def _chain(self, kind: str, nodes: list):
+        result = nodes[0]
+        for node in nodes[1:]:
+            result = self._share((kind, result, node))
+        return result
+
+    def _size_key(self, node):
+        size = self._size(node)
+        return (size is None, size or 0)
+
+    def _size(self, node) -> int | None:
+        kind = node[0]
+        if kind == "operand":
+            return self.estimate(node[1])
+        if kind == "none":
+            return 0
+        if kind == "&":
+            sizes = [s for s in (self._size(node[1]), self._size(node[2])) if s is not None]
+            return min(sizes) if sizes else None
+        if kind == "-":
+            return self._size(node[1])
+        if kind in ("|", "^"):
+            left, right = self._size(node[1]), self._size(node[2])
+            if left is None or right is None:
+                return None
+            return left + right
+        return None
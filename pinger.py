@@ -9,67 +9,90 @@ Operands resolve to a *set* of members:
     <@id>           a single member mention
 
 Operators (lowest to highest precedence): | ^ & ! ( )
+
+Sets are evaluated as member bitmasks from ``ping_index`` and only turned back
+into members once the whole expression is done.
 """
 
+import functools
+import re
+import time
+import weakref
+from collections import OrderedDict
+from typing import Iterator
+
 import discord
 from discord import app_commands
+import kronicler
+
+import ping_index
+import ping_optimizer
+
+
+class ExpressionError(ValueError):
+    """A bad target expression, with the column it went wrong at if known.
+
+    ``operand`` is set instead of ``position`` when the expression parsed but
+    an operand could not be resolved.
+    """
+
+    def __init__(self, message: str, position: int | None = None, operand: str | None = None):
+        super().__init__(message)
+        self.position = position
+        self.operand = operand
+
+
+_PUNCTUATION = {"(": "lparen", ")": "rparen", "&": "op", "|": "op", "^": "op", "!": "not"}
+# Operators, parens and the start of a mention end an operand (names may
+# contain spaces); a bare name also ends at an '@'.
+_AT_NAME_RE = re.compile(r"[^()&|^!<]*")
+_BARE_NAME_RE = re.compile(r"[^()&|^!<@]*")
 
 
-def tokenize(expr: str):
-    """Turn a target expression into a list of ``(kind, value)`` tokens."""
+def tokenize(expr: str) -> list[tuple[str, str, int, int]]:
+    """Turn a target expression into ``(kind, value, start, end)`` tokens.
+
+    ``start`` and ``end`` are character offsets into ``expr``.
+    """
     tokens = []
+    append = tokens.append
+    punctuation = _PUNCTUATION.get
+    at_name = _AT_NAME_RE.match
+    bare_name = _BARE_NAME_RE.match
     i = 0
     n = len(expr)
     while i < n:
         char = expr[i]
-        if char.isspace():
-            i += 1
-        elif char == "(":
-            tokens.append(("lparen", "("))
-            i += 1
-        elif char == ")":
-            tokens.append(("rparen", ")"))
-            i += 1
-        elif char == "&":
-            tokens.append(("op", "&"))
+        kind = punctuation(char)
+        if kind is not None:
+            append((kind, char, i, i + 1))
             i += 1
-        elif char == "|":
-            tokens.append(("op", "|"))
-            i += 1
-        elif char == "^":
-            tokens.append(("op", "^"))
-            i += 1
-        elif char == "!":
-            tokens.append(("not", "!"))
+        elif char == " " or char.isspace():
             i += 1
+        elif char == "@":
+            # A textual operand: read until the next operator/paren/mention.
+            j = at_name(expr, i + 1).end()
+            text = expr[i + 1 : j]
+            name = text.strip()
+            if not name:
+                raise ExpressionError("Empty target after '@'.", i)
+            append(("operand", "@" + name, i, i + 1 + len(text.rstrip())))
+            i = j
         elif char == "<":
             # A raw Discord mention like <@&123> (role) or <@123> (user).
             end = expr.find(">", i)
             if end == -1:
-                raise ValueError("Unterminated mention (missing '>').")
-            tokens.append(("operand", expr[i : end + 1]))
+                raise ExpressionError("Unterminated mention (missing '>').", i)
+            append(("operand", expr[i : end + 1], i, end + 1))
             i = end + 1
-        elif char == "@":
-            # A textual operand: read until the next operator/paren/mention.
-            j = i + 1
-            while j < n and expr[j] not in "&|^!()<":
-                j += 1
-            name = expr[i + 1 : j].strip()
-            if not name:
-                raise ValueError("Empty target after '@'.")
-            tokens.append(("operand", "@" + name))
-            i = j
         elif char.isalpha() or char == "_":
-            # A bare role name without '@' prefix (e.g. from the slash command).
-            j = i
-            while j < n and expr[j] not in "&|^!()<@":
-                j += 1
-            name = expr[i:j].strip()
-            if name:
-                tokens.append(("operand", "@" + name))
+            # A bare role name without '@' prefix (as autocomplete inserts them).
+            j = bare_name(expr, i).end()
+            name = expr[i:j].rstrip()
+            append(("operand", "@" + name, i, i + len(name)))
             i = j
         else:
-            raise ValueError(f"Unexpected character {char!r} in target expression.")
+            raise ExpressionError(f"Unexpected character {char!r} in target expression.", i)
     return tokens
 
 
@@ -82,35 +105,43 @@ class Parser:
     def __init__(self, tokens):
         self.tokens = tokens
         self.pos = 0
+        end = tokens[-1][3] if tokens else 0
+        self._end = ("end", "", end, end)
 
     def _peek(self):
-        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else self._end
+
+    def _at_op(self, op: str) -> bool:
+        kind, value, _, _ = self._peek()
+        return kind == "op" and value == op
 
     def parse(self):
         if not self.tokens:
-            raise ValueError("Empty target expression.")
+            raise ExpressionError("Empty target expression.", 0)
         node = self._parse_or()
         if self.pos != len(self.tokens):
-            raise ValueError("Unexpected trailing input in target expression.")
+            raise ExpressionError(
+                "Unexpected trailing input in target expression.", self._peek()[2]
+            )
         return node
 
     def _parse_or(self):
         node = self._parse_xor()
-        while self._peek() == ("op", "|"):
+        while self._at_op("|"):
             self.pos += 1
             node = ("|", node, self._parse_xor())
         return node
 
     def _parse_xor(self):
         node = self._parse_and()
-        while self._peek() == ("op", "^"):
+        while self._at_op("^"):
             self.pos += 1
             node = ("^", node, self._parse_and())
         return node
 
     def _parse_and(self):
         node = self._parse_unary()
-        while self._peek() == ("op", "&"):
+        while self._at_op("&"):
             self.pos += 1
             node = ("&", node, self._parse_unary())
         return node
@@ -122,68 +153,198 @@ class Parser:
         return self._parse_atom()
 
     def _parse_atom(self):
-        kind, value = self._peek()
+        kind, value, start, _ = self._peek()
         if kind == "lparen":
             self.pos += 1
             node = self._parse_or()
             if self._peek()[0] != "rparen":
-                raise ValueError("Missing closing parenthesis.")
+                raise ExpressionError("Missing closing parenthesis.", self._peek()[2])
             self.pos += 1
             return node
         if kind == "operand":
             self.pos += 1
             return ("operand", value)
-        raise ValueError("Expected a target, '!' or '(' in target expression.")
+        raise ExpressionError("Expected a target, '!' or '(' in target expression.", start)
 
 
-def resolve_operand(value: str, guild: discord.Guild):
-    """Resolve a single operand token to a set of ``discord.Member``."""
-    members = guild.members
-
+def format_expression_error(expr: str, exc: ValueError) -> str:
+    """Render ``exc`` for Discord, with a caret under the offending column."""
+    # Errors raised through the caches point into the normalized text, so
+    # locate the problem again in what the user actually typed.
+    position = None
+    try:
+        tokens = tokenize(expr)
+        Parser(tokens).parse()
+    except ExpressionError as raw:
+        position = raw.position
+    else:
+        operand = getattr(exc, "operand", None)
+        position = next(
+            (start for kind, value, start, _ in tokens if kind == "operand" and value == operand),
+            None,
+        )
+
+    if position is None or not expr.strip() or "\n" in expr or "`" in expr:
+        return f"⚠️ {exc}"
+    return f"⚠️ {exc}\n```\n{expr}\n{' ' * position}^\n```"
+
+
+def resolve_operand(value: str, guild: discord.Guild, index: ping_index.MemberIndex):
+    """Resolve a single operand token to a member bitmask."""
     if value.startswith("<@&") and value.endswith(">"):
         role_id = int(value[3:-1])
         role = guild.get_role(role_id)
         if role is None:
-            raise ValueError(f"Could not find the role {value}.")
-        return set(role.members)
+            raise ExpressionError(f"Could not find the role {value}.", operand=value)
+        return index.role_mask(role.id)
 
     if value.startswith("<@") and value.endswith(">"):
         member_id = int(value[2:-1].lstrip("!"))
         member = guild.get_member(member_id)
         if member is None:
-            raise ValueError(f"Could not find the member {value}.")
-        return {member}
+            raise ExpressionError(f"Could not find the member {value}.", operand=value)
+        return index.bit(member)
 
     name = value[1:] if value.startswith("@") else value
     lowered = name.lower()
 
     if lowered == "here":
-        return {m for m in members if m.status is not discord.Status.offline}
+        return index.online
     if lowered == "everyone":
-        return set(members)
+        return index.everyone
 
-    role = discord.utils.find(lambda r: r.name.lower() == lowered, guild.roles)
+    role = index.role_named(lowered)
     if role is None:
-        raise ValueError(f"Could not find a role named '{name}'.")
-    return set(role.members)
+        raise ExpressionError(f"Could not find a role named '{name}'.", operand=value)
+    return index.role_mask(role.id)
 
 
-def evaluate(node, guild: discord.Guild):
-    """Evaluate a parsed expression to a set of members."""
+def evaluate(node, guild: discord.Guild, index: ping_index.MemberIndex, memo=None) -> int:
+    """Evaluate a parsed expression to a member bitmask (see ``ping_index``).
+
+    ``memo`` maps already-evaluated nodes to their masks, so subtrees the
+    optimizer has shared are only computed once.
+    """
+    if memo is None:
+        memo = {}
+    mask = memo.get(node)
+    if mask is not None:
+        return mask
+
     kind = node[0]
     if kind == "operand":
-        return resolve_operand(node[1], guild)
-    if kind == "!":
-        return set(guild.members) - evaluate(node[1], guild)
-    left = evaluate(node[1], guild)
-    right = evaluate(node[2], guild)
-    if kind == "&":
-        return left & right
-    if kind == "|":
-        return left | right
-    if kind == "^":
-        return left ^ right
-    raise ValueError(f"Unknown operator {kind!r}.")
+        mask = resolve_operand(node[1], guild, index)
+    elif kind == "none":
+        mask = 0
+    elif kind == "!":
+        mask = index.everyone & ~evaluate(node[1], guild, index, memo)
+    else:
+        left = evaluate(node[1], guild, index, memo)
+        if kind == "&":
+            mask = left and left & evaluate(node[2], guild, index, memo)
+        elif kind == "-":
+            mask = left and left & ~evaluate(node[2], guild, index, memo)
+        elif kind == "|":
+            mask = left | evaluate(node[2], guild, index, memo)
+        elif kind == "^":
+            mask = left ^ evaluate(node[2], guild, index, memo)
+        else:
+            raise ValueError(f"Unknown operator {kind!r}.")
+
+    memo[node] = mask
+    return mask
+
+PARSE_CACHE_SIZE = 256
+RESULT_CACHE_SIZE = 64  # per guild; 0 disables result caching
+
+# Whitespace around operators and parens carries no meaning, but whitespace
+# inside a role name does, and mentions (which contain '&') must stay intact.
+_OPERATOR_SPACING = re.compile(r"(<[^>]*>)|\s*([&|^!()])\s*")
+
+# index -> (its generation the results were computed at, LRU of results).
+# Generations are only comparable within one index, so the index object itself
+# is the key; entries go away with the index when a guild's index is dropped.
+_RESULTS: weakref.WeakKeyDictionary[
+    ping_index.MemberIndex, tuple[int, OrderedDict[str, int]]
+] = weakref.WeakKeyDictionary()
+_RESULT_STATS = {"hits": 0, "misses": 0}
+
+
+def normalize_expression(expr: str) -> str:
+    """Canonical cache key for an expression: no spacing around operators."""
+    return _OPERATOR_SPACING.sub(lambda m: m.group(1) or m.group(2), expr.strip())
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def compile_expression(normalized: str):
+    """Tokenize and parse a normalized expression, remembering the AST."""
+    return Parser(tokenize(normalized)).parse()
+
+
+def _evaluate_optimized(node, guild: discord.Guild, index: ping_index.MemberIndex) -> int:
+    # Resolve every operand up front: unknown roles still error even if the
+    # optimizer would fold them away, and the masks give the size estimates
+    # used to order intersections.
+    memo = {}
+    for value in ping_optimizer.operands(node):
+        if ("operand", value) not in memo:
+            memo[("operand", value)] = resolve_operand(value, guild, index)
+
+    def estimate(value: str) -> int | None:
+        mask = memo.get(("operand", value))
+        return None if mask is None else mask.bit_count()
+
+    optimized = ping_optimizer.optimize(node, estimate)
+    return evaluate(optimized, guild, index, memo)
+
+
+def evaluate_expression(
+    expr: str,
+    guild: discord.Guild,
+    index: ping_index.MemberIndex,
+    use_result_cache: bool = True,
+) -> int:
+    """Evaluate ``expr`` to a member bitmask through the parse and result caches.
+
+    Results are only cached for the guild's stored index, and a cached result
+    is only reused while that index's generation matches the one it was
+    computed at.
+    """
+    normalized = normalize_expression(expr)
+    node = compile_expression(normalized)
+    if not use_result_cache or RESULT_CACHE_SIZE <= 0 or not ping_index.is_stored(index):
+        # A throwaway index (guild not chunked yet) is never updated by events.
+        return _evaluate_optimized(node, guild, index)
+
+    generation, results = _RESULTS.get(index, (None, None))
+    if results is None or generation != index.generation:
+        results = OrderedDict()
+        _RESULTS[index] = (index.generation, results)
+
+    mask = results.get(normalized)
+    if mask is not None:
+        _RESULT_STATS["hits"] += 1
+        results.move_to_end(normalized)
+        return mask
+
+    _RESULT_STATS["misses"] += 1
+    mask = _evaluate_optimized(node, guild, index)
+    results[normalized] = mask
+    if len(results) > RESULT_CACHE_SIZE:
+        results.popitem(last=False)
+    return mask
+
+
+def cache_stats() -> str:
+    """Summarise parse and result cache hit rates for display."""
+    parse = compile_expression.cache_info()
+    lines = [
+        f"parse cache: {parse.hits} hits, {parse.misses} misses, "
+        f"{parse.currsize}/{parse.maxsize} entries",
+        f"result cache: {_RESULT_STATS['hits']} hits, "
+        f"{_RESULT_STATS['misses']} misses, {len(_RESULTS)} guild(s)",
+    ]
+    return "\n".join(["```", *lines, "```"])
 
 
 
@@ -193,10 +354,7 @@ def _expression_prefix(current: str) -> tuple[str, str]:
     The typed_prefix is everything up to and including the last operator/paren
     (plus trailing spaces); partial_operand is the token being typed right now.
     """
-    last_op = -1
-    for i, c in enumerate(current):
-        if c in "&|^!()":
-            last_op = i
+    last_op = max(current.rfind(c) for c in "&|^!()")
     if last_op == -1:
         return "", current
     split = last_op + 1
@@ -212,51 +370,113 @@ def get_autocomplete_choices(
     prefix, partial = _expression_prefix(current)
     search = partial.lstrip("@").lower()
 
-    candidates = ["@here", "@everyone"]
     if guild:
-        for role in guild.roles:
-            if not role.is_default():
-                candidates.append(role.name)
+        matched = ping_index.get_index(guild).complete(search)
+    else:
+        matched = [c for c in ("@here", "@everyone") if search in c[1:]]
 
-    matched = [c for c in candidates if search in c.lstrip("@").lower()]
     return [
         app_commands.Choice(name=(prefix + c)[:100], value=(prefix + c)[:100])
         for c in matched[:25]
     ]
 
 
-async def send_pings_interaction(
-    interaction: discord.Interaction, members, message: str
-):
-    """Ping members via a slash command interaction, splitting at 2000 chars."""
-    allowed = discord.AllowedMentions(users=True, roles=False, everyone=False)
-
-    chunks: list[str] = []
-    current = ""
+def iter_ping_chunks(members, message: str) -> Iterator[str]:
+    """Yield member mentions packed into chunks under 2000 chars, ``message`` last."""
+    current: list[str] = []
+    length = 0
     for member in members:
         mention = member.mention
-        addition = mention if not current else " " + mention
-        if len(current) + len(addition) > 1900:
-            chunks.append(current)
-            current = mention
+        if current and length + 1 + len(mention) > 1900:
+            yield " ".join(current)
+            current = [mention]
+            length = len(mention)
         else:
-            current += addition
-    if current:
-        chunks.append(current)
+            length += len(mention) + (1 if current else 0)
+            current.append(mention)
 
+    last = " ".join(current) if current else None
     if message:
-        if chunks and len(chunks[-1]) + 1 + len(message) <= 2000:
-            chunks[-1] += " " + message
+        if last is not None and len(last) + 1 + len(message) <= 2000:
+            last += " " + message
         else:
-            chunks.append(message)
+            if last is not None:
+                yield last
+            last = message
+    if last is not None:
+        yield last
 
-    first = True
-    for chunk in chunks:
-        if first:
-            await interaction.followup.send(chunk, allowed_mentions=allowed)
-            first = False
-        else:
-            await interaction.followup.send(chunk, allowed_mentions=allowed)
+
+@kronicler.capture
+async def send_pings_interaction(interaction: discord.Interaction, members, message: str) -> float:
+    """Ping members via a slash command interaction, splitting at 2000 chars.
+
+    Chunks are sent one at a time so they land in the channel in order.
+    Returns the number of seconds spent sending.
+    """
+    allowed = discord.AllowedMentions(users=True, roles=False, everyone=False)
+
+    started = time.perf_counter()
+    sent = 0
+    for chunk in iter_ping_chunks(members, message):
+        await interaction.followup.send(chunk, allowed_mentions=allowed)
+        sent += 1
+    elapsed = time.perf_counter() - started
+
+    print(f"/ping sent {sent} chunk(s) in {elapsed:.2f}s")
+    return elapsed
+
+
+PINGCOUNT_ECHO_CHARS = 200
+
+
+def count_expression(
+    expr: str, guild: discord.Guild, index: ping_index.MemberIndex
+) -> tuple[int, list[tuple[str, int]]]:
+    """Return how many (non-bot) members ``expr`` hits, plus a count per operand."""
+    total = (evaluate_expression(expr, guild, index) & ~index.bots).bit_count()
+    node = compile_expression(normalize_expression(expr))
+    breakdown = [
+        (value, (resolve_operand(value, guild, index) & ~index.bots).bit_count())
+        for value in dict.fromkeys(ping_optimizer.operands(node))
+    ]
+    return total, breakdown
+
+
+async def handle_slash_pingcount(interaction: discord.Interaction, expression: str):
+    """Handle the /pingcount application command (a dry run of /ping)."""
+    if interaction.guild is None:
+        await interaction.response.send_message(
+            "This command can only be used in a server.", ephemeral=True
+        )
+        return
+
+    index = ping_index.get_index(interaction.guild)
+    try:
+        total, breakdown = count_expression(expression, interaction.guild, index)
+    except ValueError as exc:
+        await interaction.response.send_message(
+            format_expression_error(expression, exc), ephemeral=True
+        )
+        return
+
+    # Both the echoed expression and the breakdown are cut short so the reply
+    # stays inside Discord's 2000 character limit.
+    if len(expression) > PINGCOUNT_ECHO_CHARS:
+        expression = expression[: PINGCOUNT_ECHO_CHARS - 1] + "…"
+    width = max(len(value) for value, _ in breakdown)
+    lines = [f"`{expression}` would ping **{total}** member(s).", "```"]
+    length = len(lines[0]) + len("\n```\n```")
+    for shown, (value, count) in enumerate(breakdown):
+        line = f"{value.ljust(width)}  {count}"
+        # Leave room for the "... and N more" line.
+        if length + 1 + len(line) > 1970:
+            lines.append(f"... and {len(breakdown) - shown} more")
+            break
+        lines.append(line)
+        length += 1 + len(line)
+    lines.append("```")
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
 
 
 async def handle_slash_ping(
@@ -269,18 +489,19 @@ async def handle_slash_ping(
         await interaction.followup.send("This command can only be used in a server.")
         return
 
+    index = ping_index.get_index(interaction.guild)
     try:
-        node = Parser(tokenize(expression)).parse()
-        members = evaluate(node, interaction.guild)
+        mask = evaluate_expression(expression, interaction.guild, index)
     except ValueError as exc:
-        await interaction.followup.send(f"⚠️ {exc}")
+        await interaction.followup.send(format_expression_error(expression, exc))
         return
 
-    members = {m for m in members if not m.bot}
-    if not members:
+    mask &= ~index.bots
+    if not mask:
         await interaction.followup.send("No members matched that expression.")
         return
 
+    members = index.members(mask, interaction.guild)
     ordered = sorted(members, key=lambda m: m.display_name.lower())
     await send_pings_interaction(interaction, ordered, message)
 
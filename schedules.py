@@ -0,0 +1,147 @@
+"""Polling schedules for notification streams.
+
+A stream's ``schedule`` is either an interval or a five-field cron spec::
+
+    >>> parse_schedule("30m")
+    Interval(seconds=1800)
+    >>> from datetime import datetime
+    >>> parse_schedule("5 12 * * 1-5").next_after(datetime(2024, 6, 7, 13, 0))
+    datetime.datetime(2024, 6, 10, 12, 5)
+
+Intervals are a number followed by ``s``, ``m``, ``h`` or ``d``. Cron specs
+are ``minute hour day-of-month month day-of-week`` and accept ``*``, lists,
+ranges and ``/step``; day-of-week counts from Sunday = 0 (7 is Sunday too).
+As in cron, when both day fields are restricted a day matching either one
+runs. ``@hourly``, ``@daily`` and ``@weekly`` are shorthands. A spec that
+can never run is rejected::
+
+    >>> parse_schedule("0 0 30 2 *")
+    Traceback (most recent call last):
+    ...
+    ValueError: Schedule never matches.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+_INTERVAL_RE = re.compile(r"^(\d+)\s*([smhd])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+}
+# (low, high) for minute, hour, day of month, month, day of week.
+_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+_EPOCH = datetime(2000, 1, 1)
+
+
+@dataclass(frozen=True, slots=True)
+class Interval:
+    seconds: int
+
+    def next_after(self, moment: datetime) -> datetime:
+        return moment + timedelta(seconds=self.seconds)
+
+
+@dataclass(frozen=True, slots=True)
+class Cron:
+    minutes: frozenset[int]
+    hours: frozenset[int]
+    days: frozenset[int]
+    months: frozenset[int]
+    weekdays: frozenset[int]
+    any_day: bool
+    any_weekday: bool
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_days = moment.day in self.days
+        in_weekdays = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Return the first matching minute strictly after ``moment``."""
+        current = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Skipping whole months, days and hours at a time bounds the walk to a
+        # few hundred steps; five years covers any satisfiable spec (a 29 February
+        # comes round at least once in any four).
+        limit = current + timedelta(days=5 * 366)
+        while current < limit:
+            if current.month not in self.months:
+                year = current.year + (current.month == 12)
+                month = current.month % 12 + 1
+                current = current.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(current):
+                current = (current + timedelta(days=1)).replace(hour=0, minute=0)
+            elif current.hour not in self.hours:
+                current = (current + timedelta(hours=1)).replace(minute=0)
+            elif current.minute not in self.minutes:
+                current += timedelta(minutes=1)
+            else:
+                return current
+        raise ValueError("Schedule never matches.")
+
+
+def _parse_field(text: str, low: int, high: int) -> frozenset[int]:
+    values: set[int] = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Bad step in {text!r}.")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"{text!r} is outside {low}-{high}.")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+@lru_cache(maxsize=128)
+def parse_schedule(spec: str) -> Interval | Cron:
+    """Parse an interval or cron spec, raising ValueError if it is invalid."""
+    spec = _ALIASES.get(spec.strip().lower(), spec.strip().lower())
+    match = _INTERVAL_RE.match(spec)
+    if match:
+        seconds = int(match.group(1)) * _UNITS[match.group(2)]
+        if seconds <= 0:
+            raise ValueError("Interval must be positive.")
+        return Interval(seconds)
+
+    fields = spec.split()
+    if len(fields) != 5:
+        raise ValueError(f"Expected an interval like 30m or five cron fields, got {spec!r}.")
+    try:
+        minutes, hours, days, months, weekdays = (
+            _parse_field(field, low, high) for field, (low, high) in zip(fields, _RANGES)
+        )
+    except ValueError as exc:
+        raise ValueError(f"Invalid cron spec {spec!r}: {exc}") from None
+    if 7 in weekdays:
+        weekdays = (weekdays - {7}) | {0}
+    cron = Cron(
+        minutes=minutes,
+        hours=hours,
+        days=days,
+        months=months,
+        weekdays=weekdays,
+        any_day=fields[2] == "*",
+        any_weekday=fields[4] == "*",
+    )
+    # Specs like "0 0 30 2 *" parse but never run.
+    cron.next_after(_EPOCH)
+    return cron